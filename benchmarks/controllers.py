@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# Benchmarks every connection controller against local stand-ins, run
+# from the repository root:
+#   python benchmarks/controllers.py [--requests N] [--concurrency N]
+#       [--transfer-size BYTES] [--chunk-size BYTES] [--json FILE]
+import os
+import sys
+import json
+import socket
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+import tempfile
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from reverse_client.batch import BatchIO
+from reverse_client.stats import Histogram
+from reverse_client.utils import get_ip_port
+from reverse_client.file_transfer import FileUpload, FileDownload
+from reverse_client.connection_controller import ConnectionControllerFactory
+from stand_ins import WebshellStandIn, BindShellStandIn, connect_back
+
+http_benchmarks = [
+	("default-requests post json", "default-requests", "post", "json"),
+	("default-requests post urlencoded", "default-requests", "post", "x-www-urlencoded"),
+	("default-requests get", "default-requests", "get", "json"),
+	("async-requests post json", "async-requests", "post", "json"),
+]
+
+socket_benchmarks = [
+	("socket-client", "socket-client"),
+	("async-socket-client", "async-socket-client"),
+	("socket-listener", "socket-listener"),
+]
+
+
+class _QuietIO(BatchIO):
+
+	def __init__(self):
+		super(_QuietIO, self).__init__(logging.CRITICAL)
+
+	def print(self, txt):
+		pass
+
+
+# Socket controllers print the output through print_ansi, the
+# benchmark waits for it here
+class _CaptureIO(_QuietIO):
+
+	def __init__(self):
+		super(_CaptureIO, self).__init__()
+		self._output = ""
+		self._condition = Condition()
+
+	def write(self, txt):
+		with self._condition:
+			self._output += txt
+			self._condition.notify_all()
+
+	def print_ansi(self, txt, end="\n"):
+		self.write(txt + end)
+
+	def wait_for(self, marker, timeout=30):
+		with self._condition:
+			if not self._condition.wait_for(lambda: marker in self._output, timeout):
+				raise TimeoutError(f"No output with {marker}")
+			self._output = self._output[self._output.find(marker) + len(marker):]
+
+
+def _open(controller):
+	# Async controllers run on a loop of their own like secondary targets
+	if not controller.asynchronous:
+		return None
+	loop = asyncio.new_event_loop()
+	Thread(target=loop.run_forever, daemon=True).start()
+	asyncio.run_coroutine_threadsafe(controller.open(), loop).result()
+	return loop
+
+
+def _close(controller, loop):
+	controller.close()
+	if loop is not None:
+		loop.call_soon_threadsafe(loop.stop)
+
+
+def _latency(histogram):
+	return {
+		"p50_ms": histogram.percentile(50) / 1000,
+		"p99_ms": histogram.percentile(99) / 1000
+	}
+
+
+def _transfer(io, controller, args, workdir, chunk_size):
+	local = os.path.join(workdir, "local")
+	remote = os.path.join(workdir, "remote")
+	downloaded = os.path.join(workdir, "downloaded")
+	with open(local, "wb") as f:
+		f.write(os.urandom(args.transfer_size))
+
+	upload = FileUpload(io, controller, chunk_size, args.concurrency)
+	start = time.perf_counter()
+	upload.upload(local, remote)
+	upload_time = time.perf_counter() - start
+
+	download = FileDownload(io, controller, chunk_size, args.concurrency)
+	start = time.perf_counter()
+	download.download(remote, downloaded)
+	download_time = time.perf_counter() - start
+
+	digests = set()
+	for path in [local, remote, downloaded]:
+		with open(path, "rb") as f:
+			digests.add(hashlib.md5(f.read()).hexdigest())
+	if len(digests) != 1:
+		raise RuntimeError("Transferred files differ")
+
+	mb = args.transfer_size / 1e6
+	return {
+		"upload_mb_s": mb / upload_time,
+		"download_mb_s": mb / download_time
+	}
+
+
+def bench_http(controller_str, method, post_body_format, args):
+	stand_in = WebshellStandIn(method, post_body_format, "cmd", "token", "secret")
+	io = _QuietIO()
+	controller = ConnectionControllerFactory.get_connection_controller(
+		controller_str,
+		uri=stand_in.uri,
+		shell_io=io,
+		method=method,
+		post_body_format=post_body_format,
+		command_key="cmd",
+		token_key="token",
+		token="secret",
+		pool_maxsize=max(10, args.concurrency)
+	)
+	loop = _open(controller)
+	try:
+		histogram = Histogram()
+		for _ in range(args.requests):
+			start = time.perf_counter()
+			_, status = controller.request("echo bench")
+			histogram.record((time.perf_counter() - start) * 1e6)
+			if status != 200:
+				raise RuntimeError(f"Status code {status}")
+
+		start = time.perf_counter()
+		with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+			list(executor.map(controller.request, ["echo bench"] * args.requests))
+		result = {
+			"commands_s": args.requests / (time.perf_counter() - start),
+			**_latency(histogram)
+		}
+
+		# Chunks travel in the query string with GET, keep them within
+		# the url length servers accept
+		chunk_size = args.chunk_size if method == "post" else min(args.chunk_size, 4096)
+		with tempfile.TemporaryDirectory() as workdir:
+			result.update(_transfer(io, controller, args, workdir, chunk_size))
+		return result
+	finally:
+		_close(controller, loop)
+		stand_in.close()
+
+
+def _free_port():
+	# Port 0 can not be handed to a reverse shell, take a free one
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+def bench_socket(controller_str, args):
+	io = _CaptureIO()
+	stand_in = None
+	if controller_str == "socket-listener":
+		uri = f"127.0.0.1:{_free_port()}"
+	else:
+		stand_in = BindShellStandIn()
+		uri = stand_in.uri
+
+	controller = ConnectionControllerFactory.get_connection_controller(
+		controller_str, uri=uri, shell_io=io
+	)
+	loop = _open(controller)
+	try:
+		return _bench_socket(controller, io, uri, stand_in is None, args)
+	finally:
+		_close(controller, loop)
+		if stand_in is not None:
+			stand_in.close()
+
+
+def _bench_socket(controller, io, uri, reverse, args):
+	if reverse:
+		connect_back(*get_ip_port(uri))
+
+	# The first command also waits for the connection
+	controller.request("echo ready")
+	io.wait_for("ready\n")
+
+	histogram = Histogram()
+	for i in range(args.requests):
+		start = time.perf_counter()
+		controller.request(f"echo bench-{i}")
+		io.wait_for(f"bench-{i}\n")
+		histogram.record((time.perf_counter() - start) * 1e6)
+
+	# Commands are written back to back, the shell answers in order
+	start = time.perf_counter()
+	for i in range(args.requests):
+		controller.request(f"echo burst-{i}")
+	io.wait_for(f"burst-{args.requests - 1}\n")
+	return {
+		"commands_s": args.requests / (time.perf_counter() - start),
+		**_latency(histogram)
+	}
+
+
+def main():
+	argparser = argparse.ArgumentParser()
+	argparser.add_argument("--requests", type=int, default=200)
+	argparser.add_argument("--concurrency", type=int, default=8)
+	argparser.add_argument("--transfer-size", type=int, default=1 << 20)
+	argparser.add_argument("--chunk-size", type=int, default=64 << 10)
+	argparser.add_argument("--json")
+	args = argparser.parse_args()
+
+	benchmarks = [
+		(name, lambda c=controller_str, m=method, f=body_format: bench_http(c, m, f, args))
+		for name, controller_str, method, body_format in http_benchmarks
+	] + [
+		(name, lambda c=controller_str: bench_socket(c, args))
+		for name, controller_str in socket_benchmarks
+	]
+
+	columns = ["commands_s", "p50_ms", "p99_ms", "upload_mb_s", "download_mb_s"]
+	print(f"{'controller':<34}" + "".join(f"{column:>15}" for column in columns))
+	results = {}
+	for name, bench in benchmarks:
+		try:
+			result = bench()
+		except ImportError as e:
+			print(f"{name:<34} skipped, {e}")
+			continue
+		except Exception as e:
+			print(f"{name:<34} failed, {type(e).__name__}: {e}")
+			continue
+		results[name] = result
+		print(f"{name:<34}" + "".join(
+			f"{result[column]:>15.2f}" if column in result else f"{'-':>15}"
+			for column in columns
+		))
+
+	if args.json is not None:
+		with open(args.json, "w") as f:
+			json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+	main()
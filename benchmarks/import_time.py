@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# Measures how long the client modules take to import in a fresh
+# interpreter, run from the repository root:
+#   python benchmarks/import_time.py [--runs N]
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+modules = [
+	"main",
+	"reverse_client.shell",
+	"reverse_client.batch",
+	"reverse_client.shell_io",
+	"reverse_client.connection_controller.socket_client_controller",
+	"reverse_client.connection_controller.requests_controller",
+	"reverse_client.connection_controller.tor_requests_controller",
+	"reverse_client.connection_controller.async_requests_controller",
+]
+
+heavy_modules = ["prompt_toolkit", "pygments", "requests", "stem", "aiohttp"]
+
+
+def import_time(module):
+	# -X importtime reports the cumulative time of every import in us,
+	# the last line is the module that was asked for
+	code = (
+		f"import sys, {module}; "
+		f"print(','.join(m for m in {heavy_modules!r} if m in sys.modules))"
+	)
+	proc = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", code],
+		cwd=root, capture_output=True, text=True
+	)
+	if proc.returncode != 0:
+		return None, proc.stderr.strip().split("\n")[-1]
+
+	lines = [line for line in proc.stderr.split("\n") if line.startswith("import time:")]
+	cumulative = int(lines[-1].split("|")[1])
+	return cumulative / 1000, proc.stdout.strip()
+
+
+def main():
+	argparser = argparse.ArgumentParser()
+	argparser.add_argument("--runs", type=int, default=5)
+	args = argparser.parse_args()
+
+	print(f"{'module':<66} {'median ms':>10}  loaded")
+	for module in modules:
+		times = []
+		loaded = ""
+		for _ in range(args.runs):
+			elapsed, loaded = import_time(module)
+			if elapsed is None:
+				break
+			times.append(elapsed)
+		if not times:
+			print(f"{module:<66} {'error':>10}  {loaded}")
+			continue
+		print(f"{module:<66} {statistics.median(times):>10.1f}  {loaded or '-'}")
+
+
+if __name__ == "__main__":
+	main()
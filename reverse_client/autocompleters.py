@@ -1,4 +1,5 @@
 import os
+from bisect import bisect_left
 # from pathlib import PosixPath
 from prompt_toolkit.completion import Completer, Completion, NestedCompleter
 from .utils import tokenize
@@ -31,10 +32,62 @@ class FileAutoCompleter(Completer):
             yield Completion(completion, start_position=-len(search))
 
 
+class ExecutableIndex():
+    def __init__(self):
+        self._env_paths = []
+        self._mtimes = {}
+        self._executables = {}
+        self._index = []
+
+    @classmethod
+    def _scan(cls, env_path):
+        executables = []
+        try:
+            with os.scandir(env_path) as entries:
+                for entry in entries:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        executables.append(entry.name)
+        except OSError:
+            pass
+        return executables
+
+    def _refresh(self):
+        env_paths = os.environ.get("PATH", "").split(":")
+        changed = env_paths != self._env_paths
+        self._env_paths = env_paths
+
+        # Only directories whose mtime changed are listed again
+        for env_path in env_paths:
+            try:
+                mtime = os.stat(env_path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if env_path in self._mtimes and self._mtimes[env_path] == mtime:
+                continue
+            self._mtimes[env_path] = mtime
+            self._executables[env_path] = ExecutableIndex._scan(env_path) if mtime else []
+            changed = True
+
+        if changed:
+            executables = set()
+            for env_path in env_paths:
+                executables.update(self._executables[env_path])
+            self._index = sorted(executables)
+
+    def complete(self, prefix):
+        self._refresh()
+        index = self._index
+        i = bisect_left(index, prefix)
+        while i < len(index) and index[i].startswith(prefix):
+            yield index[i]
+            i += 1
+
+
 class ShellAutocompleter(Completer):
     def __init__(self):
         super(ShellAutocompleter, self).__init__()
         self._file_autocompleter = FileAutoCompleter()
+        self._executable_index = ExecutableIndex()
 
     @classmethod
     def _should_autocomplete_env(cls, txt):
@@ -47,38 +100,53 @@ class ShellAutocompleter(Completer):
 
 
     def get_completions(self, document, complete_event):
-        
         word_before_cursor = document.get_word_before_cursor(WORD=True)
         word_before_cursor = tokenize(";", "&&", " ")("\\")(word_before_cursor)
         word_before_cursor = word_before_cursor[-1]
 
         for item in self._file_autocompleter.get_completions(document, complete_event, word_before_cursor):
             yield item
- 
+
         if not ShellAutocompleter._should_autocomplete_env(document.text):
             return
 
+        for filename in self._executable_index.complete(word_before_cursor):
+            yield Completion(filename, start_position=-len(word_before_cursor))
 
-        autocompleted_envs = set()
 
-        env_paths = os.environ["PATH"]
-        env_paths = env_paths.split(":")
+class RemoteCompleter(Completer):
+    def __init__(self, remote_index, get_cwd):
+        super(RemoteCompleter, self).__init__()
+        self._remote_index = remote_index
+        self._get_cwd = get_cwd
 
-        for env_path in env_paths:
-            if not os.path.isdir(env_path):
+    def _path_completions(self, search):
+        cwd = self._get_cwd() or "/"
+        search_dir, search_fname = os.path.split(search)
+        directory = os.path.normpath(os.path.join(cwd, search_dir))
+
+        for entry in self._remote_index.get(directory):
+            if not entry.startswith(search_fname):
                 continue
-            for filename in os.listdir(env_path):
-                if not filename.startswith(word_before_cursor):
-                    continue
-                filepath = os.path.join(env_path, filename)
-                if not os.access(filepath, os.X_OK):
-                    continue
-                if filename in autocompleted_envs:
-                    continue
-                autocompleted_envs.add(filename)
-                yield Completion(filename, start_position=-len(word_before_cursor))
-
-       
+            yield Completion(os.path.join(search_dir, entry), start_position=-len(search))
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.lstrip()
+        if text.startswith(":"):
+            return
+
+        word_before_cursor = document.get_word_before_cursor(WORD=True)
+        word_before_cursor = tokenize(";", "&&", " ")("\\")(word_before_cursor)
+        word_before_cursor = word_before_cursor[-1]
+
+        if "/" not in word_before_cursor and ShellAutocompleter._should_autocomplete_env(text):
+            for executable in self._remote_index.executables():
+                if executable.startswith(word_before_cursor):
+                    yield Completion(executable, start_position=-len(word_before_cursor))
+            return
+
+        for item in self._path_completions(word_before_cursor):
+            yield item
 
 
 class InternalCommandsCompleter(Completer):
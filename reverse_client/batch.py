@@ -0,0 +1,191 @@
+import sys
+import json
+import time
+import logging
+from concurrent.futures import Future
+from .command_pipeline import CommandPipeline
+from .exceptions import ShellException, ShellInternalInterrupt
+
+
+class _NullProgressBar():
+
+	class _Counter():
+		items_completed = 0
+
+		def item_completed(self):
+			self.items_completed += 1
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+	def __call__(self, total=None):
+		return _NullProgressBar._Counter()
+
+
+# Plain text ShellIO for script mode, messages go to stderr so that
+# stdout only carries the JSONL results
+class BatchIO():
+
+	def __init__(self, log_level):
+		self._log_level = log_level
+
+	def _log(self, level, name, txt):
+		if self._log_level > level:
+			return
+		print(f"[{name}] {txt}", file=sys.stderr, flush=True)
+
+	def debug(self, txt):
+		self._log(logging.DEBUG, "debug", txt)
+
+	def info(self, txt):
+		self._log(logging.INFO, "info", txt)
+
+	def warning(self, txt):
+		self._log(logging.WARNING, "warning", txt)
+
+	def error(self, txt):
+		self._log(logging.ERROR, "error", txt)
+
+	def print(self, txt):
+		print(txt, file=sys.stderr, flush=True)
+
+	def print_with_color(self, txt, color):
+		self.print(txt)
+
+	def print_ansi(self, txt, end="\n"):
+		print(txt, end=end, file=sys.stderr, flush=True)
+
+	def text_with_ansi(self, txt):
+		return txt
+
+	def set_prompt(self, txt):
+		pass
+
+	def input_text_color(self, txt, color=None):
+		return txt
+
+	def progress_bar(self, txt):
+		self.info(txt)
+		return _NullProgressBar()
+
+	def shell_input(self, txt, save_history=True, valid_input=None):
+		# Nothing can be answered in script mode
+		raise KeyboardInterrupt()
+
+	def external_shell_input(self, txt, save_history=True):
+		raise KeyboardInterrupt()
+
+	def add_to_shell_history(self, txt):
+		pass
+
+	def add_to_external_shell_history(self, txt):
+		pass
+
+	def set_remote_completer(self, remote_index, get_cwd):
+		pass
+
+	def clear(self):
+		pass
+
+
+class BatchPipeline(CommandPipeline):
+
+	def __init__(self, shell, workers, output=sys.stdout):
+		super(BatchPipeline, self).__init__(shell, workers)
+		self._output = output
+		self._index = 0
+		self.failed = 0
+
+	def submit(self, user_input):
+		try:
+			super(BatchPipeline, self).submit(user_input)
+		except Exception as e:
+			# Failures are still reported in order with the other results
+			future = Future()
+			future.set_exception(e)
+			self._slots.acquire()
+			self._queue.put((user_input, None, future))
+
+	def _request(self, cmd, key=None):
+		start = time.monotonic()
+		response = super(BatchPipeline, self)._request(cmd, key)
+		return response, time.monotonic() - start
+
+	def _cached(self, response):
+		return response, 0
+
+	def _process(self, snapshot, future):
+		shell = self._shell
+		response, elapsed = future.result() if future is not None else (None, None)
+		with self._lock:
+			try:
+				shell._restore(snapshot)
+				if response is not None:
+					shell._set_response(*response)
+				shell._process_response()
+				request = shell._request
+				return {
+					"output": shell._decode(request["command_output"]),
+					"result": request["command_result"],
+					"status": response[1] if response is not None else None,
+					"elapsed": round(elapsed, 6) if elapsed is not None else None
+				}
+			finally:
+				shell._reset()
+
+	def _handle(self, user_input, snapshot, future):
+		record = {
+			"index": self._index,
+			"command": user_input,
+			"output": None,
+			"result": None,
+			"status": None,
+			"elapsed": None,
+			"error": None
+		}
+		self._index += 1
+
+		try:
+			record.update(self._process(snapshot, future))
+		except ShellInternalInterrupt:
+			pass
+		except Exception as e:
+			record["error"] = str(e) or type(e).__name__
+
+		if record["error"] is not None or record["result"] not in [None, "0"]:
+			self.failed += 1
+		self._output.write(json.dumps(record) + "\n")
+		self._output.flush()
+
+
+def read_script(path):
+	if path == "-":
+		lines = sys.stdin.read().splitlines()
+	else:
+		try:
+			with open(path) as f:
+				lines = f.read().splitlines()
+		except OSError as e:
+			raise ShellException(e)
+	return [
+		line.strip() for line in lines
+		if line.strip() and not line.strip().startswith("#")
+	]
+
+
+def run_script(shell, commands, workers=1, output=sys.stdout):
+	if shell.connection_controller.interactive:
+		raise NotImplementedError("Script mode needs a controller that returns the command output")
+
+	if not shell._pre_start():
+		return 1
+
+	pipeline = BatchPipeline(shell, workers, output)
+	for command in commands:
+		pipeline.submit(command)
+	pipeline.close()
+	shell.connection_controller.close()
+	return 1 if pipeline.failed else 0
@@ -0,0 +1,108 @@
+import traceback
+from queue import Queue
+from threading import Thread, RLock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, Future
+from .exceptions import ShellException, ShellInternalInterrupt
+
+
+class CommandPipeline():
+
+	def __init__(self, shell, workers):
+		self._shell = shell
+		self._io = shell._io
+		self._executor = ThreadPoolExecutor(max_workers=workers)
+		# Keeps typing ahead bounded to a few commands per worker
+		self._slots = BoundedSemaphore(workers * 2)
+		# The shell keeps the state of one request at a time
+		self._lock = RLock()
+		self._queue = Queue()
+		Thread(target=self._process_thread, daemon=True).start()
+
+	@classmethod
+	def _changes_state(cls, command):
+		cmd = command["real"]
+		return (cmd.startswith("cd ") or cmd.startswith("su ") or
+			cmd in ["whoami", "pwd"])
+
+	def submit(self, user_input):
+		shell = self._shell
+		# Internal commands read the shell state and may transfer
+		# files, so every command before them has to finish first
+		if user_input is not None and user_input.strip().startswith(":"):
+			self.drain()
+
+		self._slots.acquire()
+		try:
+			with self._lock:
+				try:
+					shell._get_user_input(user_input)
+					cmd = shell._prepare_request()
+					key, cached = shell._cache_lookup() if cmd is not None else (None, None)
+					snapshot = shell._snapshot()
+				finally:
+					shell._reset()
+		except BaseException:
+			self._slots.release()
+			raise
+
+		future = None
+		if cached is not None:
+			future = Future()
+			future.set_result(self._cached(cached))
+		elif cmd is not None:
+			future = self._executor.submit(self._request, cmd, key)
+		self._queue.put((user_input, snapshot, future))
+
+		# Later commands are built from the cwd and user this one sets
+		if self._changes_state(snapshot[0]) or snapshot[1]["internal_command"] is not None:
+			self.drain()
+
+	def _request(self, cmd, key=None):
+		response = self._shell.connection_controller.request(cmd)
+		self._shell._cache_store(key, response)
+		return response
+
+	def _cached(self, response):
+		return response
+
+	def _process(self, snapshot, future):
+		shell = self._shell
+		response = future.result() if future is not None else None
+		with self._lock:
+			try:
+				shell._restore(snapshot)
+				if response is not None:
+					shell._set_response(*response)
+				shell._process_response()._print_response()
+			finally:
+				shell._reset()
+
+	def _handle(self, user_input, snapshot, future):
+		try:
+			self._process(snapshot, future)
+		except ShellInternalInterrupt:
+			pass
+		except (ShellException, NotImplementedError, ConnectionError) as e:
+			self._io.error(e)
+		except Exception:
+			traceback.print_exc()
+
+	def _process_thread(self):
+		# Responses are processed in the order the commands were typed
+		while True:
+			user_input, snapshot, future = self._queue.get()
+			try:
+				self._handle(user_input, snapshot, future)
+			except Exception:
+				# The thread has to keep going or drain would never return
+				traceback.print_exc()
+			finally:
+				self._slots.release()
+				self._queue.task_done()
+
+	def drain(self):
+		self._queue.join()
+
+	def close(self):
+		self.drain()
+		self._executor.shutdown()
@@ -4,24 +4,36 @@ import configparser
 import logging
 from .utils import url_regex, socket_regex, ip_regex, Namespace, get_logging_level_number
 
+target_section_prefix = "TARGET "
+
 def parse_config():
-	config = configparser.ConfigParser()
+	# No default section so that target sections only hold their own keys
+	config = configparser.ConfigParser(default_section="")
 
 	if not os.path.isfile("config.ini"):
 		print("config.ini does not exist, will read from command line arguments")
-		return Namespace(), []
+		return Namespace(), [], {}
 
 	config.read("config.ini")
 	args = {}
 	cli_args = []
+	targets = {}
 	for section in config:
+		if section.startswith(target_section_prefix):
+			target = section[len(target_section_prefix):].strip()
+			targets[target] = []
+			for arg, value in config.items(section):
+				targets[target].append(f"--{arg}")
+				targets[target].append(value)
+			continue
+
 		for arg, value in config.items(section):
 			# args[arg.replace("-", "_")] = value
 			args[arg] = value
 			arg = f"--{arg}"
 			cli_args.append(arg)
 			cli_args.append(value)
-	return Namespace(**args), cli_args
+	return Namespace(**args), cli_args, targets
 
 
 def get_config():
@@ -70,7 +82,7 @@ def get_config():
 
 
 	argparser = argparse.ArgumentParser()
-	args, cli_args = parse_config()
+	args, cli_args, target_cli_args = parse_config()
 
 	group = argparser.add_mutually_exclusive_group(
 		required="listen" not in args and "uri" not in args
@@ -88,6 +100,10 @@ def get_config():
 		type=_uri_type,
 		default=args.uri
 	)
+	argparser.add_argument(
+		"--script",
+		default=args.script
+	)
 	argparser.add_argument(
 		"--method",
 		choices=["post", "get"],
@@ -122,6 +138,70 @@ def get_config():
 		choices=["command", "command-result"],
 		default=args.last_line or "command"
 	)
+	argparser.add_argument(
+		"--compress",
+		choices=["on", "off"],
+		default=args.compress or "off"
+	)
+	argparser.add_argument(
+		"--chunk-size",
+		type=_number_type(int, minimum=0, maximum=None),
+		default=args.chunk_size or 0
+	)
+	argparser.add_argument(
+		"--transfer-workers",
+		type=_number_type(int, minimum=1, maximum=None),
+		default=args.transfer_workers or 1
+	)
+	argparser.add_argument(
+		"--transfer-retries",
+		type=_number_type(int, minimum=0, maximum=None),
+		default=args.transfer_retries or 3
+	)
+	argparser.add_argument(
+		"--pipeline-workers",
+		type=_number_type(int, minimum=1, maximum=None),
+		default=args.pipeline_workers or 1
+	)
+	argparser.add_argument(
+		"--response-cache",
+		choices=["on", "off"],
+		default=args.response_cache or "off"
+	)
+	argparser.add_argument(
+		"--response-cache-ttl",
+		type=_number_type(float, minimum=0, maximum=None),
+		default=args.response_cache_ttl or 60
+	)
+	argparser.add_argument(
+		"--remote-completion",
+		choices=["on", "off"],
+		default=args.remote_completion or "off"
+	)
+	argparser.add_argument(
+		"--completion-ttl",
+		type=_number_type(float, minimum=0, maximum=None),
+		default=args.completion_ttl or 30
+	)
+	argparser.add_argument(
+		"--job-poll-interval",
+		type=_number_type(float, minimum=0.1, maximum=None),
+		default=args.job_poll_interval or 1
+	)
+	argparser.add_argument(
+		"--stats",
+		choices=["on", "off"],
+		default=args.stats or "off"
+	)
+	argparser.add_argument(
+		"--stats-file",
+		default=args.stats_file
+	)
+	argparser.add_argument(
+		"--decode-errors",
+		choices=["strict", "replace", "backslashreplace", "ignore"],
+		default=args.decode_errors or "replace"
+	)
 	argparser.add_argument(
 		"--log-level",
 		choices=["notset", "debug", "info", "warning", "error"],
@@ -132,10 +212,42 @@ def get_config():
 		choices=[
 			"default-requests",
 			"tor-requests",
-			"socket-client"
+			"socket-client",
+			"async-requests",
+			"async-socket-client"
 		],
 		default=args.connection_controller or "default_requests_controller"
 	)
+	argparser.add_argument(
+		"--keep-alive",
+		choices=["on", "off"],
+		default=args.keep_alive or "on"
+	)
+	argparser.add_argument(
+		"--forward-shell",
+		choices=["on", "off"],
+		default=args.forward_shell or "off"
+	)
+	argparser.add_argument(
+		"--forward-shell-timeout",
+		type=_number_type(float, minimum=0, maximum=None),
+		default=args.forward_shell_timeout or 30
+	)
+	argparser.add_argument(
+		"--forward-shell-kill-on-timeout",
+		choices=["on", "off"],
+		default=args.forward_shell_kill_on_timeout or "off"
+	)
+	argparser.add_argument(
+		"--pool-connections",
+		type=_number_type(int, minimum=1, maximum=None),
+		default=args.pool_connections or 1
+	)
+	argparser.add_argument(
+		"--pool-maxsize",
+		type=_number_type(int, minimum=1, maximum=None),
+		default=args.pool_maxsize or 10
+	)
 	argparser.add_argument(
 		"--tor-ip",
 		type=_ip_type, 
@@ -162,14 +274,36 @@ def get_config():
 	)
 	argparser.add_argument(
 		"--tor-ensure-ip-change",
-		type=bool,
-		default=args.tor_ensure_ip_change or False
+		default=args.tor_ensure_ip_change or "off"
 	)
 
 	argparser.parse_args(cli_args)
 
 	args = argparser.parse_args()
 
+	# Targets inherit every argument they do not set themselves,
+	# except the listening address which only one of them can bind
+	targets = {
+		name: argparser.parse_args(
+			target_args,
+			namespace=argparse.Namespace(**{**vars(args), "listen": None})
+		)
+		for name, target_args in target_cli_args.items()
+	}
+
+	for target in [args, *targets.values()]:
+		_validate(argparser, target)
+
+	args.targets = targets
+	return args
+
+
+def _validate(argparser, args):
+	# Listening replaces the uri, shells connect back to this address
+	if args.listen is not None:
+		args.connection_controller = "socket-listener"
+		args.uri = args.listen
+
 	if (args.connection_controller in ["default_requests", "tor_requests"] and
 		not url_regex.match(args.uri)):
 		argparser.error("argument --uri: Not a url")
@@ -182,5 +316,16 @@ def get_config():
 		argparser.error("argument --token: requires --token-key, define it in config.ini or as a command line argument")
 
 	args.log_level = get_logging_level_number(args.log_level.upper())
-
-	return args
\ No newline at end of file
+	args.keep_alive = args.keep_alive == "on"
+	args.compress = args.compress == "on"
+	args.remote_completion = args.remote_completion == "on"
+	args.response_cache = args.response_cache == "on"
+	args.forward_shell = args.forward_shell == "on"
+	args.forward_shell_kill_on_timeout = args.forward_shell_kill_on_timeout == "on"
+	# Accepts the True/False of older configuration files too
+	args.tor_ensure_ip_change = str(args.tor_ensure_ip_change).lower() in ["on", "true", "yes", "1"]
+	if (args.forward_shell and
+		args.connection_controller not in ["default-requests", "tor-requests"]):
+		argparser.error("argument --forward-shell: requires the default-requests or tor-requests controller")
+	# Dumping the stats needs them recorded
+	args.stats = args.stats == "on" or args.stats_file is not None
\ No newline at end of file
@@ -0,0 +1,36 @@
+import asyncio
+from abc import abstractmethod
+from .connection_controller import ConnectionController
+
+
+class AsyncConnectionController(ConnectionController):
+
+	def __init__(self, interactive):
+		super(AsyncConnectionController, self).__init__(
+			interactive=interactive, asynchronous=True
+		)
+		self._loop = None
+
+	async def open(self):
+		self._loop = asyncio.get_running_loop()
+
+	def request(self, *args, **kwargs):
+		# Blocking access for worker threads, the coroutine still runs
+		# on the loop that opened the controller
+		future = asyncio.run_coroutine_threadsafe(
+			self.request_async(*args, **kwargs), self._loop
+		)
+		return future.result()
+
+	@abstractmethod
+	async def request_async(self, *args, **kwargs):
+		pass
+
+	def close(self):
+		if self._loop is None or self._loop.is_closed():
+			return
+		asyncio.run_coroutine_threadsafe(self.close_async(), self._loop).result()
+
+	@abstractmethod
+	async def close_async(self):
+		pass
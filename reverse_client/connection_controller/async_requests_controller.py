@@ -0,0 +1,43 @@
+import aiohttp
+from .async_connection_controller import AsyncConnectionController
+from .requests_controller import RequestsController
+from .exceptions import RequestError
+
+
+class AsyncRequestsController(RequestsController, AsyncConnectionController):
+
+	def __init__(self, uri, shell_io, method, post_body_format,
+		command_key, token_key, token, keep_alive=True,
+		pool_connections=1, pool_maxsize=10, *args, **kwargs):
+
+		super(AsyncRequestsController, self).__init__(
+			uri, shell_io, method, post_body_format,
+			command_key, token_key, token, keep_alive,
+			pool_connections, pool_maxsize
+		)
+		self._session = None
+
+	async def open(self):
+		await super(AsyncRequestsController, self).open()
+		connector = aiohttp.TCPConnector(
+			limit=self._pool_maxsize,
+			force_close=not self._keep_alive
+		)
+		self._session = aiohttp.ClientSession(connector=connector)
+
+	def request(self, cmd):
+		return AsyncConnectionController.request(self, cmd)
+
+	async def request_async(self, cmd):
+		try:
+			async with self._make_request(self._session, cmd) as response:
+				content = await response.read()
+				return RequestsController._process_content(content, response.status)
+
+		except Exception as e:
+			raise RequestError(e)
+
+	async def close_async(self):
+		if self._session is not None:
+			await self._session.close()
+		self._session = None
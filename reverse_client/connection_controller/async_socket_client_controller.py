@@ -0,0 +1,88 @@
+import asyncio
+from ..utils import get_ip_port
+from .async_connection_controller import AsyncConnectionController
+from .socket_stream import SocketStream
+from .exceptions import SocketConnectionError
+
+
+class AsyncSocketClientController(AsyncConnectionController):
+
+	def __init__(self, uri, shell_io, decode_errors="replace", *args, **kwargs):
+
+		super(AsyncSocketClientController, self).__init__(interactive=True)
+
+		self._uri = uri
+		self._ip, self._port = get_ip_port(uri)
+		self._shell_io = shell_io
+		self._decode_errors = decode_errors
+
+		self._reader = None
+		self._writer = None
+		self._stream = None
+		self._connect_lock = None
+		self._listener = None
+
+	async def open(self):
+		await super(AsyncSocketClientController, self).open()
+		self._connect_lock = asyncio.Lock()
+		self._listener = asyncio.ensure_future(self._listener_task())
+
+	async def _connect(self):
+		async with self._connect_lock:
+			if self._writer is not None:
+				return True
+			try:
+				self._reader, self._writer = await asyncio.open_connection(
+					self._ip, self._port
+				)
+			except OSError:
+				return False
+			self._shell_io.info(f"Connected to {self._uri}")
+			return True
+
+	def _disconnect(self):
+		if self._writer is not None:
+			self._writer.close()
+		self._reader, self._writer = None, None
+
+	async def _listener_task(self):
+		while True:
+			if not await self._connect():
+				await asyncio.sleep(0.5)
+				continue
+			# Output goes through the same line framing and prompt
+			# handling as the selector based client
+			if self._stream is None:
+				self._stream = SocketStream(None, self._shell_io, decode_errors=self._decode_errors)
+
+			try:
+				data = await self._reader.read(4096)
+			except OSError as e:
+				data = b""
+
+			if not data:
+				self._shell_io.error(f"Connection to {self._uri} closed")
+				self._disconnect()
+				self._stream = None
+				continue
+
+			self._stream.feed(data)
+
+	async def request_async(self, cmd):
+		if not await self._connect():
+			raise SocketConnectionError(f"Could not connect to socket {self._uri}")
+
+		if not cmd.endswith("\n"):
+			cmd += "\n"
+
+		try:
+			self._writer.write(cmd.encode("utf-8"))
+			await self._writer.drain()
+		except OSError as e:
+			self._disconnect()
+			raise SocketConnectionError(e)
+
+	async def close_async(self):
+		if self._listener is not None:
+			self._listener.cancel()
+		self._disconnect()
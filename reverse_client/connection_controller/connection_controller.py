@@ -1,19 +1,96 @@
+import asyncio
+from uuid import uuid4
 from abc import abstractmethod
+from ..utils import frame_command, parse_framed_output, FramedOutputReader
+from .exceptions import RequestError
 
 
 class ConnectionController():
 
-	def __init__(self, interactive):
+	def __init__(self, interactive, asynchronous=False):
 		self._interactive = interactive
+		self._asynchronous = asynchronous
 
 	@property
 	def interactive(self):
 		return self._interactive
 
+	@property
+	def asynchronous(self):
+		return self._asynchronous
+
+	@property
+	def stateful(self):
+		# Whether commands run in one remote shell that keeps its state
+		return False
+
+	@property
+	def stateless(self):
+		# The controller to use for commands that do not need the state
+		return self
+
+	@property
+	def streaming(self):
+		# Whether request_stream hands out the response as it is read
+		return False
+
 	@abstractmethod
 	def request(self, *args, **kwargs):
 		pass
 
+	def request_raw_output(self, cmd):
+		# Only the output between the sentinels is kept, so anything the
+		# webshell adds around it (e.g. the exit code) is dropped, the
+		# output comes back byte for byte along with the exit code
+		frame_id = uuid4().hex
+		data, status = self.request(frame_command(cmd, frame_id))
+		if status != 200:
+			raise RequestError(f"Status code {status}")
+		output, exit_code = parse_framed_output(data, frame_id, strip_newline=False)
+		if output is None:
+			raise RequestError("The response is missing the output sentinels")
+		return output, exit_code
+
+	def request_output(self, cmd):
+		output, exit_code = self.request_raw_output(cmd)
+		if exit_code != "0":
+			raise RequestError(f"Command exited with {exit_code}")
+		if output.endswith(b"\n"):
+			output = output[:-1]
+		return output.decode("utf-8", errors="replace")
+
+	def request_stream(self, cmd):
+		# The response as an iterable of bytes and the status code,
+		# controllers that can not stream return it in one piece
+		data, status = self.request(cmd)
+		return [data], status
+
+	def stream_output(self, cmd, write):
+		# Like request_output but the output goes to write as it arrives
+		frame_id = uuid4().hex
+		chunks, status = self.request_stream(frame_command(cmd, frame_id))
+		if status != 200:
+			raise RequestError(f"Status code {status}")
+		reader = FramedOutputReader(frame_id)
+		for chunk in chunks:
+			output = reader.feed(chunk)
+			if output:
+				write(output)
+		exit_code = reader.close()
+		if exit_code is None:
+			raise RequestError("The response is missing the output sentinels")
+		if exit_code != "0":
+			raise RequestError(f"Command exited with {exit_code}")
+
+	async def open(self):
+		pass
+
+	async def request_async(self, *args, **kwargs):
+		return await asyncio.to_thread(self.request, *args, **kwargs)
+
 	@abstractmethod
 	def close(self):
-		pass
\ No newline at end of file
+		pass
+
+	async def close_async(self):
+		return await asyncio.to_thread(self.close)
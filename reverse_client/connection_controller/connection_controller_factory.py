@@ -1,7 +1,4 @@
 from ..utils import url_regex, socket_regex
-from .requests_controller import DefaultRequestsController
-from .tor_requests_controller import TorRequestsController
-from .socket_client_controller import SocketClientController
 
 
 class ConnectionControllerFactory():
@@ -9,12 +6,26 @@ class ConnectionControllerFactory():
 	@classmethod
 	def get_connection_controller(cls, controller_str, *args, **kwargs):
 		
+		# Controllers are imported here so that requests, stem and aiohttp
+		# are only loaded, and only needed, when they are used
 		if controller_str == "default-requests":
+			from .requests_controller import DefaultRequestsController
 			return DefaultRequestsController(*args, **kwargs)
 		elif controller_str == "tor-requests":
+			from .tor_requests_controller import TorRequestsController
 			return TorRequestsController(*args, **kwargs)
 		elif controller_str == "socket-client":
+			from .socket_client_controller import SocketClientController
 			return SocketClientController(*args, **kwargs)
+		elif controller_str == "socket-listener":
+			from .socket_listener_controller import SocketListenerController
+			return SocketListenerController(*args, **kwargs)
+		elif controller_str == "async-requests":
+			from .async_requests_controller import AsyncRequestsController
+			return AsyncRequestsController(*args, **kwargs)
+		elif controller_str == "async-socket-client":
+			from .async_socket_client_controller import AsyncSocketClientController
+			return AsyncSocketClientController(*args, **kwargs)
 		else:
 			raise NotImplementedError("Not implemented")
 
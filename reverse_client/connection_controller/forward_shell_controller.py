@@ -0,0 +1,167 @@
+import time
+from uuid import uuid4
+from shlex import quote
+from threading import Lock
+from ..utils import frame_command, parse_framed_output
+from .connection_controller import ConnectionController
+from .exceptions import RequestError
+
+
+class ForwardShellController(ConnectionController):
+
+	_min_poll_delay = 0.01
+	_max_poll_delay = 0.5
+	_max_output_size = 1 << 20
+
+	def __init__(self, connection_controller, shell_io, timeout=30,
+				kill_on_timeout=False, directory="/tmp"):
+
+		super(ForwardShellController, self).__init__(interactive=False)
+
+		self._connection_controller = connection_controller
+		self._shell_io = shell_io
+		self._timeout = timeout
+		self._kill_on_timeout = kill_on_timeout
+		self._directory = directory
+
+		# Commands go one at a time to the single remote shell
+		self._lock = Lock()
+		self._session = None
+		self._offset = 0
+
+	@property
+	def stateful(self):
+		return True
+
+	@property
+	def stateless(self):
+		return self._connection_controller
+
+	@property
+	def streaming(self):
+		return self._connection_controller.streaming
+
+	def request_stream(self, cmd):
+		# Bulk transfers do not need the shell state, they bypass it
+		return self._connection_controller.request_stream(cmd)
+
+	def _run(self, cmd):
+		# A plain request of the wrapped controller
+		return self._connection_controller.request_raw_output(cmd)
+
+	def _open(self):
+		path = f"{self._directory}/.{uuid4().hex}"
+		# The shell opens its fifo for reading and writing so that it
+		# never reads an end of file between commands, and appends to
+		# its output so that the file can be truncated under it, its own
+		# session lets _stop reach the commands it started
+		output, exit_code = self._run(
+			f"mkdir -m 700 {path} && mkfifo {path}/in && : > {path}/out && "
+			f"{{ if command -v setsid >/dev/null 2>&1; then setsid sh <>{path}/in >>{path}/out 2>&1 & "
+			f"else sh <>{path}/in >>{path}/out 2>&1 & fi; echo $!; }}"
+		)
+		if exit_code != "0":
+			raise RequestError(f"Could not start the forward shell: {output.decode('utf-8', errors='replace')}")
+		pid = int(output.strip())
+		self._shell_io.info(f"Forward shell {pid} reading commands from {path}/in")
+		self._session = (path, pid)
+		self._offset = 0
+
+	def _read(self, path, pid, cmd=None):
+		# Only the bytes past the offset are pulled, a command is sent
+		# along with the first read, kill -0 tells whether the shell
+		# is still alive
+		send = f"printf '%s\\n' {quote(cmd)} 1<>{path}/in; " if cmd is not None else ""
+		output, exit_code = self._run(f"{send}tail -c +{self._offset + 1} {path}/out; kill -0 {pid} 2>/dev/null")
+		self._offset += len(output)
+		return output, exit_code == "0"
+
+	def _stop(self):
+		# Killing the process group takes the running command along,
+		# without setsid its direct children are killed by parent pid
+		path, pid = self._session
+		self._session = None
+		self._run(
+			f"{{ kill -TERM -{pid} || {{ pkill -TERM -P {pid}; kill -TERM {pid}; }}; }} 2>/dev/null; "
+			f"rm -rf {path}"
+		)
+
+	def _interrupt(self, pid):
+		# Only the processes the command started are killed, the shell
+		# goes on with its state, a command made of builtins alone
+		# keeps running
+		self._run(
+			f"{{ pkill -TERM -P {pid} || kill -TERM $(ps -o pid= --ppid {pid}); }} 2>/dev/null"
+		)
+
+	def _truncate(self, path):
+		if self._offset < ForwardShellController._max_output_size:
+			return
+		self._run(f": > {path}/out")
+		self._offset = 0
+
+	def request(self, cmd):
+		with self._lock:
+			if self._session is None:
+				self._open()
+			path, pid = self._session
+
+			# stdin is closed so that a command reading it does not
+			# swallow the commands queued after it
+			frame_id = uuid4().hex
+			framed = frame_command(f"{{ {cmd}\n}} </dev/null", frame_id)
+
+			deadline = time.monotonic() + self._timeout
+			delay = ForwardShellController._min_poll_delay
+			content, alive = self._read(path, pid, framed)
+			while True:
+				output, exit_code = parse_framed_output(content, frame_id, strip_newline=False)
+				if exit_code is not None:
+					break
+				if not alive:
+					# A command that ends the shell (e.g. exit) still
+					# has its output up to there, it may have been
+					# written after the last read
+					self._session = None
+					data, _ = self._read(path, pid)
+					output, exit_code = parse_framed_output(content + data, frame_id, strip_newline=False)
+					if output is not None:
+						break
+					raise RequestError(f"The forward shell {pid} exited")
+				if time.monotonic() > deadline:
+					# The command would hold the shell and every command
+					# queued behind it, what is left of its output is
+					# skipped by the next one, which only looks past its
+					# own start sentinel
+					if self._kill_on_timeout:
+						try:
+							self._stop()
+						except ConnectionError as e:
+							self._shell_io.debug(f"Could not stop the forward shell {pid}: {e}")
+						self._shell_io.warning(f"Forward shell {pid} stopped, the next command starts a new one without its state")
+						raise RequestError(f"No output sentinel after {self._timeout} seconds")
+					try:
+						self._interrupt(pid)
+					except ConnectionError as e:
+						self._shell_io.debug(f"Could not interrupt the command of the forward shell {pid}: {e}")
+					self._shell_io.warning(f"Command interrupted after {self._timeout} seconds")
+					if output is None:
+						raise RequestError(f"No output sentinel after {self._timeout} seconds")
+					break
+				time.sleep(delay)
+				delay = min(delay * 2, ForwardShellController._max_poll_delay)
+				data, alive = self._read(path, pid)
+				content += data
+
+			self._truncate(path)
+			return output, 200
+
+	def close(self):
+		with self._lock:
+			if self._session is not None:
+				_, pid = self._session
+				try:
+					self._stop()
+				except ConnectionError as e:
+					self._shell_io.debug(f"Could not stop the forward shell {pid}: {e}")
+		self._connection_controller.close()
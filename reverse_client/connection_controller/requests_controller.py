@@ -1,7 +1,10 @@
+import re
 import traceback
 from .connection_controller import ConnectionController
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from ..utils import framed_output_start, compressed_output_start
 from .exceptions import RequestError
 
 class RequestsController(ConnectionController):
@@ -15,8 +18,16 @@ class RequestsController(ConnectionController):
 		"Upgrade-Insecure-Requests":"1"
 	}
 
+	# A start sentinel and the newline after it, which tells whether the
+	# webshell sends newlines as is or as a literal \\n
+	_marker_regex = re.compile(
+		b"(?:" + re.escape(framed_output_start.encode("utf-8")) + b"|" +
+		re.escape(compressed_output_start.encode("utf-8")) + b")[0-9a-f]+(\n|\\\\n)"
+	)
+
 	def __init__(self, uri, shell_io, method, post_body_format,
-		command_key, token_key, token):
+		command_key, token_key, token, keep_alive=True,
+		pool_connections=1, pool_maxsize=10):
 
 		super(RequestsController, self).__init__(interactive=False)
 
@@ -27,62 +38,119 @@ class RequestsController(ConnectionController):
 		self._command_key = command_key
 		self._token_key = token_key
 		self._token = token
+		self._keep_alive = keep_alive
+		self._pool_connections = pool_connections
+		self._pool_maxsize = pool_maxsize
+
+		self._headers = dict(RequestsController._headers)
+		self._headers["Connection"] = "keep-alive" if keep_alive else "close"
+
+	def _new_session(self):
+		session = requests.Session()
+		adapter = HTTPAdapter(
+			pool_connections=self._pool_connections,
+			pool_maxsize=self._pool_maxsize
+		)
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+		return session
 
 	def request(self, session, cmd):
 		return self._make_request(session, cmd)
 
-	def _make_request(self, session, cmd):
+	def _make_request(self, session, cmd, stream=False):
 		body = {
 			self._command_key: cmd
 		}
 
-		headers = RequestsController._headers
+		headers = self._headers
+		# Only requests sessions stream, aiohttp ones share this method
+		options = {"stream": True} if stream else {}
 
 		if self._token is not None:
 			body[self._token_key] = self._token
 
 		if self._method.upper() == "GET":
 			self._shell_io.debug(f"Doing GET at {self._uri} and parameters: {json.dumps(body)}")
-			return session.request("GET", self._uri, headers=headers, params=body)
+			return session.request("GET", self._uri, headers=headers, params=body, **options)
 		if self._method.upper() == "POST":
 			if self._post_body_format == "x-www-urlencoded":
 				self._shell_io.debug(f"Doing POST at {self._uri} and body: {json.dumps(body)}")
-				return session.request("POST", self._uri, headers=headers, data=body)
+				return session.request("POST", self._uri, headers=headers, data=body, **options)
 			elif self._post_body_format == "json":
 				self._shell_io.debug(f"Doing POST at {self._uri} and json: {json.dumps(body)}")
-				return session.request("POST", self._uri, headers=headers, json=body)
+				return session.request("POST", self._uri, headers=headers, json=body, **options)
 			else:
 				raise NotImplementedError(f"{self._post_body_format} not implemented for method POST")
 		else:
 			raise NotImplementedError(f"{self._method} not implemented")
 	
+	@classmethod
+	def _stream_response(cls, response, chunk_size=65536):
+		# The body is read and handed out chunk by chunk, the connection
+		# goes back to the pool once it is consumed or dropped
+		try:
+			for chunk in response.iter_content(chunk_size):
+				yield chunk
+		except requests.RequestException as e:
+			raise RequestError(e)
+		finally:
+			response.close()
+
 	@classmethod	
 	def _process_response(cls, response):
-		response_content = response.content.decode("utf-8")
-		status_code = response.status_code
-
-		response_content = response_content.split("\\n");
+		return cls._process_content(response.content, response.status_code)
+
+	@classmethod
+	def _process_content(cls, content, status_code):
+		# The content stays bytes, it is only decoded once it is shown.
+		# Framed or compressed output is left to whoever framed or
+		# compressed the command, only its newlines are restored
+		match = cls._marker_regex.search(content)
+		if match is not None:
+			if match.group(1) != b"\n":
+				content = content.replace(b"\\n", b"\n")
+			return content, status_code
+
+		response_content = content.split(b"\\n");
 		response_content = map(lambda x: x.strip(), response_content)
-		response_content = filter(lambda x: x != "", response_content)
-		response_content = "\n".join(response_content)
+		response_content = filter(lambda x: x != b"", response_content)
+		response_content = b"\n".join(response_content)
 
 		return response_content, status_code
 
 class DefaultRequestsController(RequestsController):
 
 	def __init__(self, uri, shell_io, method, post_body_format,
-		command_key, token_key, token, *args, **kwargs):
+		command_key, token_key, token, keep_alive=True,
+		pool_connections=1, pool_maxsize=10, *args, **kwargs):
 		
 		super(DefaultRequestsController, self).__init__(
 			uri, shell_io, method, post_body_format,
-			command_key, token_key, token
+			command_key, token_key, token, keep_alive,
+			pool_connections, pool_maxsize
 		)
+		self._session = self._new_session()
 
 	def request(self, cmd):
 		try:
-			response = super(DefaultRequestsController, self).request(requests, cmd)
+			response = super(DefaultRequestsController, self).request(self._session, cmd)
 			
 			return RequestsController._process_response(response)
 
 		except Exception as e:
-			raise RequestError(e)
\ No newline at end of file
+			raise RequestError(e)
+
+	@property
+	def streaming(self):
+		return True
+
+	def request_stream(self, cmd):
+		try:
+			response = self._make_request(self._session, cmd, stream=True)
+		except Exception as e:
+			raise RequestError(e)
+		return RequestsController._stream_response(response), response.status_code
+
+	def close(self):
+		self._session.close()
\ No newline at end of file
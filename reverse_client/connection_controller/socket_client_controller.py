@@ -1,109 +1,172 @@
+import time
+import errno
 import socket
+import selectors
+from collections import deque
 from threading import Thread
 from ..utils import get_ip_port
 from .connection_controller import ConnectionController
+from .socket_stream import SocketStream
 from .exceptions import SocketConnectionError
-import time
 
 
 class SocketClientController(ConnectionController):
 
-	def __init__(self, uri, shell_io, *args, **kwargs):
+	_min_retry_delay = 0.5
+	_max_retry_delay = 5
+
+	def __init__(self, uri, shell_io, decode_errors="replace", *args, **kwargs):
 
 		super(SocketClientController, self).__init__(interactive=True)
 
 		self._uri = uri
 		self._ip, self._port =  get_ip_port(uri)
 		self._shell_io = shell_io
+		self._decode_errors = decode_errors
 
 		self._connected = False
+		self._connecting = False
+		self._closed = False
+		self._stream = None
+		self._retry_at = 0
+		self._retry_delay = SocketClientController._min_retry_delay
+
+		# Commands wait here until the stream is connected
+		self._send_queue = deque()
+
+		# Writing to the wakeup socket interrupts select when a command
+		# is queued or the controller is closed
+		self._wakeup_r, self._wakeup_w = socket.socketpair()
+		self._wakeup_r.setblocking(False)
+		self._wakeup_w.setblocking(False)
 
-		self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		# self._socket.setblocking(False)
-		# self._socket.settimeout(0.5)
-		Thread(target=self._listener_thread).start()
+		self._selector = selectors.DefaultSelector()
+		self._selector.register(self._wakeup_r, selectors.EVENT_READ)
 
+		Thread(target=self._io_thread, daemon=True).start()
 
-	def _connect(self, silent=False):
+	def _wakeup(self):
 		try:
-			self._socket.connect((self._ip, self._port))
-			self._connected = True
-			self._shell_io.info(f"Connected to {self._uri}")
-			return True
-		except (ConnectionRefusedError, ConnectionAbortedError) as e:
-			if not silent:
-				self._shell_io.error(f"Could not connect to socket {self._uri}")
-			self._connected = False
+			self._wakeup_w.send(b"\0")
+		except (BlockingIOError, OSError):
+			pass
+
+	def _update_events(self):
+		if self._stream is None:
+			return
+		if self._connecting:
+			events = selectors.EVENT_WRITE
+		else:
+			while self._send_queue:
+				self._stream.queue(self._send_queue.popleft())
+			events = selectors.EVENT_READ
+			if self._stream.writing:
+				events |= selectors.EVENT_WRITE
+		self._selector.modify(self._stream.socket, events)
+
+	def _connect(self):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		sock.setblocking(False)
+		err = sock.connect_ex((self._ip, self._port))
+		if err not in [0, errno.EINPROGRESS, errno.EWOULDBLOCK]:
+			sock.close()
 			return False
+		self._stream = SocketStream(sock, self._shell_io, decode_errors=self._decode_errors)
+		self._connecting = True
+		self._selector.register(sock, selectors.EVENT_WRITE)
+		return True
+
+	def _on_connect(self):
+		err = self._stream.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		self._connecting = False
+		if err != 0:
+			self._disconnect(notify=False)
+			return False
+		self._connected = True
+		self._shell_io.info(f"Connected to {self._uri}")
+		self._update_events()
+		return True
 
-	def _listener_thread(self):
-		while True:
-			connected = self._connected
-			if not connected:
-				connected = self._connect(silent=True)
-				
-			if not connected:
-				time.sleep(0.5)
-				continue
-
-			data = self._socket.recv(1024)
-			data = data.decode("utf-8")
-			data = data.split("\n");
-			data = map(lambda x: x.strip(), data)
-			data = filter(lambda x: x != "", data)
-			data = list(data)
+	def _disconnect(self, notify=True):
+		if self._stream is not None:
 			try:
-				data, prompt = data[:-1], data[-1]
-			except IndexError:
-				prompt = ""
-			data = "\n".join(data)
-			# data = data + "\n" + prompt
-			# time.sleep(1)
-			# ss = self._shell_io._shell_session
-			# print('Before', ss.message)
-			print([prompt])
-			prompt = self._shell_io.text_with_ansi(prompt)
-			self._shell_io._shell_session.message = prompt
-			# setattr(self._shell_io._shell_session, 'message', prompt)
-			# print('After', ss.message)
-
-			# for item in dir(self._shell_io._shell_session):
-				# attr = getattr(self._shell_io._shell_session, item)
-				# print(item, attr)
-			# continue
-
-			# if data:
-				# print(data, end='')
-
-
-	def _request_thread(self, cmd):
-		connected = self._connected
-		
-		if not self._connected:
-			connected = self._connect(silent=True)
-
-		if not connected:
-			return self._shell_io.error(f"Could not connect to socket {self._uri}")
-
-		if not cmd.endswith("\n"):
-			cmd += "\n"
-		cmd = cmd.encode("utf-8")
-
-		try:
-			sent = self._socket.send(cmd)
-		except (OSError, BrokenPipeError) as e:
-			self._connected = False
-			self._shell_io.error(e)
+				self._selector.unregister(self._stream.socket)
+			except (KeyError, ValueError):
+				pass
+			self._stream.close()
+		if notify and self._connected:
+			self._shell_io.error(f"Connection to {self._uri} closed")
+
+		self._stream = None
+		self._connected = False
+		self._connecting = False
+
+	def _connect_failed(self):
+		if self._send_queue:
+			self._shell_io.error(f"Could not connect to socket {self._uri}")
+			self._send_queue.clear()
+		self._retry_at = time.monotonic() + self._retry_delay
+		self._retry_delay = min(self._retry_delay * 2, SocketClientController._max_retry_delay)
+
+	def _io_thread(self):
+		while not self._closed:
+			if self._stream is None and time.monotonic() >= self._retry_at:
+				if not self._connect():
+					self._connect_failed()
+
+			# Select only times out while waiting to connect again
+			timeout = None
+			if self._stream is None:
+				timeout = max(0, self._retry_at - time.monotonic())
+
+			for key, mask in self._selector.select(timeout):
+				if key.fileobj is self._wakeup_r:
+					try:
+						while self._wakeup_r.recv(1024):
+							pass
+					except (BlockingIOError, OSError):
+						pass
+					# A queued command retries the connection right away
+					if self._stream is None and self._send_queue:
+						self._retry_at = 0
+						self._retry_delay = SocketClientController._min_retry_delay
+					elif self._connected:
+						self._update_events()
+					continue
+
+				if self._stream is None or key.fileobj is not self._stream.socket:
+					continue
+				if self._connecting:
+					if self._on_connect():
+						self._retry_delay = SocketClientController._min_retry_delay
+					else:
+						self._connect_failed()
+					continue
+				if mask & selectors.EVENT_READ and not self._stream.read():
+					self._disconnect()
+					continue
+				if mask & selectors.EVENT_WRITE:
+					if not self._stream.write():
+						self._disconnect()
+						continue
+					self._update_events()
+
+		self._disconnect(notify=False)
+		self._selector.close()
+		self._wakeup_r.close()
+		self._wakeup_w.close()
 
 	def request(self, cmd):
-		Thread(target=self._request_thread, args=(cmd,)).start()
+		if self._closed:
+			raise SocketConnectionError(f"Connection to {self._uri} is closed")
 
+		if not cmd.endswith("\n"):
+			cmd += "\n"
+		self._send_queue.append(cmd.encode("utf-8"))
+		self._wakeup()
 
 	def close(self):
-		try:
-			self._socket.shutdown(socket.SHUT_WR)
-		except:
-			pass
-		self._socket.close()
+		self._closed = True
+		self._wakeup()
 
-# python -c 'import pty;pty.spawn("/bin/bash")'
\ No newline at end of file
+# python -c 'import pty;pty.spawn("/bin/bash")'
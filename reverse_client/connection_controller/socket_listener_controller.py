@@ -0,0 +1,182 @@
+import socket
+import selectors
+from threading import Thread, Lock
+from ..utils import get_ip_port
+from .connection_controller import ConnectionController
+from .socket_stream import SocketStream
+from .exceptions import SocketConnectionError
+
+
+class SocketListenerController(ConnectionController):
+
+	_backlog = 16
+
+	def __init__(self, uri, shell_io, max_buffer=65536, decode_errors="replace", *args, **kwargs):
+
+		super(SocketListenerController, self).__init__(interactive=True)
+
+		self._uri = uri
+		self._ip, self._port = get_ip_port(uri)
+		self._shell_io = shell_io
+		self._max_buffer = max_buffer
+		self._decode_errors = decode_errors
+
+		self._closed = False
+		self._lock = Lock()
+		self._connections = {}
+		self._addresses = {}
+		self._active = None
+		self._next_id = 1
+
+		self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		try:
+			self._server.bind((self._ip, self._port))
+		except OSError as e:
+			self._server.close()
+			raise SocketConnectionError(f"Could not listen on {self._ip}:{self._port}: {e}")
+		self._server.listen(SocketListenerController._backlog)
+		self._server.setblocking(False)
+
+		self._wakeup_r, self._wakeup_w = socket.socketpair()
+		self._wakeup_r.setblocking(False)
+		self._wakeup_w.setblocking(False)
+
+		self._selector = selectors.DefaultSelector()
+		self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+		self._selector.register(self._server, selectors.EVENT_READ)
+
+		shell_io.info(f"Listening on {self._ip}:{self._port}")
+		Thread(target=self._io_thread, daemon=True).start()
+
+	@property
+	def connections(self):
+		with self._lock:
+			return [
+				(connection_id, self._addresses[connection_id], connection_id == self._active)
+				for connection_id in self._connections
+			]
+
+	def select(self, connection_id):
+		with self._lock:
+			if connection_id not in self._connections:
+				raise SocketConnectionError(f"No connection with id {connection_id}")
+			if self._active is not None:
+				self._connections[self._active].detach()
+			self._active = connection_id
+			self._connections[connection_id].attach()
+
+	def _wakeup(self):
+		try:
+			self._wakeup_w.send(b"\0")
+		except (BlockingIOError, OSError):
+			pass
+
+	def _update_events(self, stream):
+		events = selectors.EVENT_READ
+		if stream.writing:
+			events |= selectors.EVENT_WRITE
+		self._selector.modify(stream.socket, events, stream)
+
+	def _accept(self):
+		# Accept everything that is waiting without blocking
+		while True:
+			try:
+				sock, address = self._server.accept()
+			except (BlockingIOError, InterruptedError):
+				return
+			except OSError as e:
+				self._shell_io.error(e)
+				return
+
+			sock.setblocking(False)
+			stream = SocketStream(sock, self._shell_io, self._max_buffer, self._decode_errors)
+			with self._lock:
+				connection_id = self._next_id
+				self._next_id += 1
+				self._connections[connection_id] = stream
+				self._addresses[connection_id] = f"{address[0]}:{address[1]}"
+				if self._active is None:
+					self._active = connection_id
+				else:
+					stream.detach()
+			self._selector.register(sock, selectors.EVENT_READ, stream)
+			self._shell_io.info(f"Connection {connection_id} from {address[0]}:{address[1]}")
+
+	def _disconnect(self, stream):
+		with self._lock:
+			connection_id = next(
+				(i for i, s in self._connections.items() if s is stream), None
+			)
+			self._connections.pop(connection_id, None)
+			self._addresses.pop(connection_id, None)
+			if self._active == connection_id:
+				self._active = None
+		try:
+			self._selector.unregister(stream.socket)
+		except (KeyError, ValueError):
+			pass
+		stream.close()
+		self._shell_io.error(f"Connection {connection_id} closed")
+
+	def _io_thread(self):
+		while not self._closed:
+			for key, mask in self._selector.select():
+				if key.fileobj is self._wakeup_r:
+					try:
+						while self._wakeup_r.recv(1024):
+							pass
+					except (BlockingIOError, OSError):
+						pass
+					with self._lock:
+						streams = list(self._connections.values())
+					for stream in streams:
+						self._update_events(stream)
+					continue
+
+				if key.fileobj is self._server:
+					self._accept()
+					continue
+
+				stream = key.data
+				# Reading under the lock keeps output in order when the
+				# active connection is switched
+				with self._lock:
+					readable = not mask & selectors.EVENT_READ or stream.read()
+				if not readable:
+					self._disconnect(stream)
+					continue
+				if mask & selectors.EVENT_WRITE:
+					if not stream.write():
+						self._disconnect(stream)
+						continue
+					self._update_events(stream)
+
+		with self._lock:
+			streams = list(self._connections.values())
+			self._connections.clear()
+		for stream in streams:
+			stream.close()
+		self._server.close()
+		self._selector.close()
+		self._wakeup_r.close()
+		self._wakeup_w.close()
+
+	def request(self, cmd):
+		if self._closed:
+			raise SocketConnectionError(f"Listener on {self._uri} is closed")
+
+		with self._lock:
+			stream = self._connections.get(self._active)
+			if stream is None:
+				raise SocketConnectionError(
+					"No active connection, list them with :connections and select one with :connections <id>"
+				)
+			if not cmd.endswith("\n"):
+				cmd += "\n"
+			stream.queue(cmd.encode("utf-8"))
+		self._wakeup()
+
+	def close(self):
+		self._closed = True
+		self._wakeup()
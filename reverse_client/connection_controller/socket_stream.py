@@ -0,0 +1,127 @@
+import codecs
+from collections import deque
+
+
+class SocketStream():
+
+	_min_recv_size = 1024
+	_max_recv_size = 65536
+	_max_partial_line = 4096
+
+	def __init__(self, sock, shell_io, max_buffer=65536, decode_errors="replace"):
+		self._socket = sock
+		self._shell_io = shell_io
+		self._max_buffer = max_buffer
+
+		self._send_queue = deque()
+		self._send_buffer = b""
+
+		self._decoder = codecs.getincrementaldecoder("utf-8")(errors=decode_errors)
+		self._recv_size = SocketStream._min_recv_size
+		self._pending = ""
+
+		# Output of a detached stream is kept here until it is attached
+		self._attached = True
+		self._buffer = deque()
+		self._buffer_size = 0
+
+	@property
+	def socket(self):
+		return self._socket
+
+	@property
+	def writing(self):
+		return bool(self._send_buffer or self._send_queue)
+
+	def queue(self, data):
+		self._send_queue.append(data)
+
+	def clear_queue(self):
+		self._send_queue.clear()
+
+	def _set_prompt(self):
+		# Whatever is left without a newline is the remote prompt
+		if self._pending.strip():
+			self._shell_io.set_prompt(self._shell_io.text_with_ansi(self._pending.strip()))
+
+	def _output(self, txt):
+		if self._attached:
+			self._shell_io.print_ansi(txt, end="")
+			return
+
+		self._buffer.append(txt)
+		self._buffer_size += len(txt)
+		# Only the most recent output is kept
+		while self._buffer_size > self._max_buffer and len(self._buffer) > 1:
+			self._buffer_size -= len(self._buffer.popleft())
+
+	def attach(self):
+		self._attached = True
+		if self._buffer:
+			self._shell_io.print_ansi("".join(self._buffer), end="")
+		self._buffer.clear()
+		self._buffer_size = 0
+		self._set_prompt()
+
+	def detach(self):
+		self._attached = False
+
+	def feed(self, data):
+		# Also used by controllers that read the socket themselves, the
+		# stream then has no socket of its own
+		# Multibyte characters split between two reads are kept by
+		# the decoder until they are complete
+		try:
+			text = self._decoder.decode(data)
+		except UnicodeDecodeError as e:
+			# A strict decoder still shows the output, escaped
+			self._shell_io.warning(f"Could not decode the output: {e}")
+			self._decoder.reset()
+			text = data.decode("utf-8", errors="backslashreplace")
+		pending = self._pending + text
+		pending = pending.replace("\r\n", "\n")
+
+		lines_end = pending.rfind("\n") + 1
+		if lines_end == 0 and len(pending) > SocketStream._max_partial_line:
+			lines_end = len(pending)
+		if lines_end:
+			self._output(pending[:lines_end])
+			pending = pending[lines_end:]
+		self._pending = pending
+
+		if self._attached:
+			self._set_prompt()
+
+	def read(self):
+		try:
+			data = self._socket.recv(self._recv_size)
+		except (BlockingIOError, InterruptedError):
+			return True
+		except OSError:
+			data = b""
+
+		if not data:
+			return False
+		# Grow the receive size while the peer keeps filling it
+		if len(data) == self._recv_size:
+			self._recv_size = min(self._recv_size * 2, SocketStream._max_recv_size)
+		self.feed(data)
+		return True
+
+	def write(self):
+		# Partial sends keep the rest of the buffer, like sendall
+		while self._send_buffer or self._send_queue:
+			if not self._send_buffer:
+				self._send_buffer = self._send_queue.popleft()
+			try:
+				sent = self._socket.send(self._send_buffer)
+			except (BlockingIOError, InterruptedError):
+				break
+			except OSError as e:
+				self._shell_io.error(e)
+				return False
+			self._send_buffer = self._send_buffer[sent:]
+		return True
+
+	def close(self):
+		self._socket.close()
@@ -13,11 +13,14 @@ class TorRequestsController(RequestsController):
 	def __init__(self, uri, shell_io, method, 
 				post_body_format, command_key, token_key, token,
 				tor_ip, tor_port, tor_control_port,
-				tor_control_password, tor_refresh_ip_every):
+				tor_control_password, tor_refresh_ip_every,
+				keep_alive=True, pool_connections=1, pool_maxsize=10,
+				tor_ensure_ip_change=False, *args, **kwargs):
 		
 		super(TorRequestsController, self).__init__(
 			uri, shell_io, method, 
-			post_body_format, command_key, token_key, token
+			post_body_format, command_key, token_key, token,
+			keep_alive, pool_connections, pool_maxsize
 		)
 		shell_io.info("TorRequests: Initiating")
 		shell_io.debug(f"TorRequests: socks5://{tor_ip}:{tor_port}")
@@ -27,9 +30,24 @@ class TorRequestsController(RequestsController):
 		self._tor_control_port = tor_control_port
 		self._tor_control_password = tor_control_password
 		self._tor_refresh_ip_every = tor_refresh_ip_every
+		# Circuits are only rotated when asked for, every rotation drops
+		# the pooled connections
+		self._tor_ensure_ip_change = tor_ensure_ip_change
+
+		self._proxies = {
+			"http":  f"socks5://{tor_ip}:{tor_port}",
+			"https": f"socks5://{tor_ip}:{tor_port}"
+		}
 
 		self._lock = Lock()
 		self._conn_error = None
+		self._generation = 0
+		self._session = None
+		self._session_generation = None
+		# Requests in flight per session, a replaced session is only
+		# closed once its last request is done
+		self._in_flight = {}
+		self._retired = set()
 
 		
 		timer = Timer(1, self._callback)
@@ -51,15 +69,37 @@ class TorRequestsController(RequestsController):
 		timer.daemon = True
 		timer.start()
 
-	def request(self, cmd):
+	def _acquire_session(self):
+		# Pooled connections stay on the circuit they were opened on, so
+		# the session is only rebuilt once the circuit has been rotated
 		with self._lock:
-			session = requests.session()
-
+			if self._session_generation != self._generation:
+				if self._session is not None:
+					self._retire(self._session)
+				self._session = self._new_session()
+				self._session.proxies = self._proxies
+				self._session_generation = self._generation
+			session = self._session
+			self._in_flight[session] = self._in_flight.get(session, 0) + 1
+			return session
+
+	def _retire(self, session):
+		if self._in_flight.get(session, 0) == 0:
+			self._in_flight.pop(session, None)
+			session.close()
+		else:
+			self._retired.add(session)
+
+	def _release_session(self, session):
+		with self._lock:
+			self._in_flight[session] -= 1
+			if session in self._retired and self._in_flight[session] == 0:
+				self._retired.discard(session)
+				del self._in_flight[session]
+				session.close()
 
-		session.proxies = {
-			"http":  f"socks5://{self._tor_ip}:{self._tor_port}",
-			"https": f"socks5://{self._tor_ip}:{self._tor_port}"
-		}
+	def request(self, cmd):
+		session = self._acquire_session()
 		try:
 			response = super(TorRequestsController, self).request(session, cmd)
 
@@ -69,6 +109,27 @@ class TorRequestsController(RequestsController):
 		except Exception as e:
 			print(type(e))
 			exit(0)
+		finally:
+			self._release_session(session)
+
+	@property
+	def streaming(self):
+		return True
+
+	def _stream(self, session, response):
+		try:
+			yield from RequestsController._stream_response(response)
+		finally:
+			self._release_session(session)
+
+	def request_stream(self, cmd):
+		session = self._acquire_session()
+		try:
+			response = self._make_request(session, cmd, stream=True)
+		except ConnectionError as e:
+			self._release_session(session)
+			raise TorConnectionError(e)
+		return self._stream(session, response), response.status_code
 
 	# signal TOR for a new connection 
 	def _renew_connection(self, run_dry=False):
@@ -76,20 +137,36 @@ class TorRequestsController(RequestsController):
 		with Controller.from_port(port=self._tor_control_port) as controller:
 			controller.authenticate(password=self._tor_control_password)
 
-			if run_dry:
+			if run_dry or not self._tor_ensure_ip_change:
+				return True
+
+			if not controller.is_newnym_available():
+				self._shell_io.debug(
+					f"TorRequests: NEWNYM rate limited for {controller.get_newnym_wait():.1f}s"
+				)
 				return True
 
-			# controller.signal(Signal.NEWNYM)
+			controller.signal(Signal.NEWNYM)
+			self._generation += 1
 		return True
 
+	def close(self):
+		with self._lock:
+			for session in [self._session, *self._retired]:
+				if session is not None:
+					session.close()
+			self._session = None
+			self._session_generation = None
+			self._in_flight.clear()
+			self._retired.clear()
+
 	def _test_ip(self):
-		session = requests.session()
+		session = self._acquire_session()
                 # http://icanhazip.com/
-		session.proxies = {
-			"http":  f"socks5://{self._tor_ip}:{self._tor_port}",
-			"https": f"socks5://{self._tor_ip}:{self._tor_port}"
-		}
-		print(session.get("http://httpbin.org/ip"))
+		try:
+			print(session.get("http://httpbin.org/ip"))
+		finally:
+			self._release_session(session)
 
 
 # https://stackoverflow.com/questions/30286293/make-requests-using-python-over-tor
@@ -0,0 +1,345 @@
+import os
+import gzip
+import zlib
+from hashlib import md5
+from shlex import quote
+from base64 import b64encode, b64decode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .utils import Base64Decoder
+from .exceptions import ShellException
+
+
+class FileTransfer():
+
+	def __init__(self, shell_io, connection_controller,
+				chunk_size, workers=1, retries=3, compress=False):
+		self._io = shell_io
+		self._connection_controller = connection_controller
+		self._chunk_size = chunk_size
+		self._workers = workers
+		self._retries = retries
+		self._compress = compress
+		self._remote_gzip = None
+
+	@property
+	def chunk_size(self):
+		return self._chunk_size
+
+	@property
+	def enabled(self):
+		return (self._chunk_size > 0 and
+			not self._connection_controller.interactive)
+
+	@property
+	def streaming(self):
+		return (self._connection_controller.streaming and
+			not self._connection_controller.interactive)
+
+	@property
+	def compress(self):
+		if not self._compress or self._connection_controller.interactive:
+			return False
+		if self._remote_gzip is None:
+			try:
+				output = self._run("command -v gzip >/dev/null 2>&1 && echo yes || echo no")
+			except (ConnectionError, ShellException):
+				return False
+			self._remote_gzip = "yes" in output
+		return self._remote_gzip
+
+	@classmethod
+	def _remote_path(cls, path, cwd):
+		if cwd is None or os.path.isabs(path):
+			return path
+		return os.path.normpath(os.path.join(cwd, path))
+
+	def _run(self, cmd):
+		return self._connection_controller.request_output(cmd)
+
+	def _retry(self, f, description):
+		for attempt in range(self._retries + 1):
+			try:
+				return f()
+			except (ConnectionError, ShellException) as e:
+				self._io.debug(f"{description} failed on attempt {attempt + 1}: {e}")
+		raise ShellException(f"{description} failed after {self._retries + 1} attempts")
+
+
+class FileUpload(FileTransfer):
+
+	def _read_chunk(self, filepath, index, compress):
+		with open(filepath, "rb") as f:
+			f.seek(index * self._chunk_size)
+			data = f.read(self._chunk_size)
+		if compress:
+			data = gzip.compress(data)
+		return b64encode(data).decode("utf-8")
+
+	@classmethod
+	def _decode_command(cls, compress):
+		return "base64 -d | gzip -dc" if compress else "base64 -d"
+
+	def _remote_size(self, targetpath):
+		output = self._run(f"wc -c 2>/dev/null < {quote(targetpath)} || echo 0")
+		try:
+			return int(output.strip() or 0)
+		except ValueError:
+			raise ShellException(f"Could not read the size of {targetpath}: {output}")
+
+	def _truncate(self, targetpath, offset):
+		self._run(
+			f"truncate -s {offset} {quote(targetpath)} 2>/dev/null || "
+			f"dd if=/dev/null of={quote(targetpath)} bs=1 seek={offset} 2>/dev/null"
+		)
+
+	def _append_chunk(self, filepath, targetpath, index, size, compress):
+		redirect = ">" if index == 0 else ">>"
+		offset = index * self._chunk_size
+		expected_size = min(size, offset + self._chunk_size)
+		data = self._read_chunk(filepath, index, compress)
+		decode = FileUpload._decode_command(compress)
+		first_attempt = True
+
+		def _f():
+			nonlocal first_attempt
+			# A lost response can still mean the append happened, and a
+			# failed one may have written part of the chunk, so the file
+			# is cut back to where the chunk starts before appending again
+			if not first_attempt:
+				if self._remote_size(targetpath) == expected_size:
+					return
+				self._truncate(targetpath, offset)
+			first_attempt = False
+			self._run(f"echo {data} | {decode} {redirect} {quote(targetpath)}")
+
+		self._retry(_f, f"Chunk {index}")
+
+	def _write_part(self, filepath, targetpath, index, compress):
+		data = self._read_chunk(filepath, index, compress)
+		decode = FileUpload._decode_command(compress)
+		part = quote(f"{targetpath}.part{index}")
+		self._retry(
+			lambda: self._run(f"echo {data} | {decode} > {part}"),
+			f"Chunk {index}"
+		)
+
+	def _upload_sequential(self, filepath, targetpath, size, n_chunks, compress, counter):
+		for index in range(n_chunks):
+			self._append_chunk(filepath, targetpath, index, size, compress)
+			counter.item_completed()
+
+	def _upload_parallel(self, filepath, targetpath, n_chunks, compress, counter):
+		errors = []
+		with ThreadPoolExecutor(max_workers=self._workers) as executor:
+			futures = [
+				executor.submit(self._write_part, filepath, targetpath, index, compress)
+				for index in range(n_chunks)
+			]
+			for future in as_completed(futures):
+				try:
+					future.result()
+					counter.item_completed()
+				except ShellException as e:
+					errors.append(str(e))
+
+		# The parts are named after the quoted target path so that the
+		# remote shell expands only the part index
+		parts = quote(f"{targetpath}.part")
+		if errors:
+			self._retry(
+				lambda: self._run(f"rm -f {parts}*"),
+				"Cleanup"
+			)
+			raise ShellException(", ".join(errors))
+
+		# Parts are only removed once reassembly succeeded so that
+		# reassembly can be retried
+		self._retry(
+			lambda: self._run(
+				f"for i in $(seq 0 {n_chunks - 1}); do cat {parts}$i || exit 1; done > {quote(targetpath)}"
+			),
+			"Reassembly"
+		)
+		self._retry(
+			lambda: self._run(f"rm -f {parts}*"),
+			"Cleanup"
+		)
+
+	def _verify(self, filepath, targetpath, size):
+		checksum = md5()
+		try:
+			with open(filepath, "rb") as f:
+				for block in iter(lambda: f.read(1 << 16), b""):
+					checksum.update(block)
+		except OSError as e:
+			raise ShellException(e)
+
+		output = self._retry(
+			lambda: self._run(f"wc -c < {quote(targetpath)} && md5sum < {quote(targetpath)}"),
+			"Verification"
+		)
+		lines = output.strip().split("\n")
+		try:
+			remote_size = int(lines[0].strip())
+			remote_checksum = lines[-1].split(" ")[0]
+		except (ValueError, IndexError):
+			raise ShellException(f"Could not verify {targetpath}: {output}")
+		if remote_size != size or remote_checksum != checksum.hexdigest():
+			raise ShellException(
+				f"Uploaded file {targetpath} does not match, "
+				f"{remote_size} bytes with md5 {remote_checksum}"
+			)
+
+	def upload(self, filepath, targetpath, cwd=None):
+		try:
+			size = os.path.getsize(filepath)
+		except OSError as e:
+			raise ShellException(e)
+
+		targetpath = FileTransfer._remote_path(targetpath, cwd)
+		n_chunks = max(1, -(-size // self._chunk_size))
+		compress = self.compress
+
+		with self._io.progress_bar(f"Uploading {filepath} to {targetpath}") as pb:
+			counter = pb(total=n_chunks)
+			if self._workers > 1:
+				self._upload_parallel(filepath, targetpath, n_chunks, compress, counter)
+			else:
+				self._upload_sequential(filepath, targetpath, size, n_chunks, compress, counter)
+		self._verify(filepath, targetpath, size)
+
+		self._io.print_with_color(f"Uploaded file to {targetpath}", "yellow")
+
+
+class FileDownload(FileTransfer):
+
+	def _fetch_chunk(self, filepath, index, compress):
+		dd = f"dd if={quote(filepath)} bs={self._chunk_size} skip={index} count=1 2>/dev/null"
+		encode = "gzip -c | base64" if compress else "base64"
+
+		def _f():
+			output = self._run(f"{dd} | {encode} && {dd} | md5sum")
+			lines = output.strip().split("\n")
+			checksum = lines[-1].split(" ")[0]
+			try:
+				data = b64decode("".join(lines[:-1]))
+				data = gzip.decompress(data) if compress else data
+			except (ValueError, OSError, EOFError, zlib.error) as e:
+				raise ShellException(e)
+			if md5(data).hexdigest() != checksum:
+				raise ShellException("Checksum mismatch")
+			return data
+
+		return self._retry(_f, f"Chunk {index}")
+
+	def stream(self, filepath, targetpath, cwd=None):
+		# The whole file comes back in one response, it is decoded and
+		# written as it is read so it is never held in memory
+		filepath = FileTransfer._remote_path(filepath, cwd)
+		compress = self.compress
+		encode = f"gzip -c < {quote(filepath)} | base64" if compress else f"base64 < {quote(filepath)}"
+		decoder = Base64Decoder()
+		decompressor = zlib.decompressobj(wbits=31) if compress else None
+
+		partpath = f"{targetpath}.part"
+		try:
+			with open(partpath, "wb") as f:
+				def _write(data):
+					data = decoder.decode(data)
+					if decompressor is not None:
+						data = decompressor.decompress(data)
+					f.write(data)
+
+				self._io.info(f"Streaming {filepath} to {targetpath}")
+				self._connection_controller.stream_output(f"[ -r {quote(filepath)} ] && {encode}", _write)
+				decoder.flush()
+				if decompressor is not None:
+					f.write(decompressor.flush())
+					if not decompressor.eof:
+						raise ValueError("Incomplete gzip data")
+			os.replace(partpath, targetpath)
+		except (ConnectionError, ValueError, zlib.error, OSError) as e:
+			try:
+				os.remove(partpath)
+			except OSError:
+				pass
+			raise ShellException(e)
+		self._io.print_with_color(f"Downloaded file to {targetpath}", "yellow")
+
+	def _remote_stat(self, filepath):
+		# The size and the modification time tell whether a partial
+		# download still belongs to the remote file
+		output = self._run(
+			f"wc -c < {quote(filepath)} && "
+			f"{{ stat -c %Y {quote(filepath)} 2>/dev/null || date -r {quote(filepath)} +%s 2>/dev/null || echo; }}"
+		)
+		lines = output.strip().split("\n")
+		try:
+			size = int(lines[0].strip())
+		except ValueError:
+			raise ShellException(f"Could not read the size of {filepath}: {output}")
+		mtime = lines[1].strip() if len(lines) > 1 else ""
+		return size, f"{size} {mtime}"
+
+	@classmethod
+	def _resume_offset(cls, partpath, infopath, identity):
+		try:
+			if not os.path.isfile(partpath):
+				return 0
+			with open(infopath) as f:
+				if f.read().strip() != identity:
+					return 0
+			return os.path.getsize(partpath)
+		except FileNotFoundError:
+			return 0
+		except OSError as e:
+			raise ShellException(e)
+
+	def download(self, filepath, targetpath, cwd=None):
+		filepath = FileTransfer._remote_path(filepath, cwd)
+		size, identity = self._retry(
+			lambda: self._remote_stat(filepath),
+			f"Reading the size of {filepath}"
+		)
+		n_chunks = max(1, -(-size // self._chunk_size))
+		compress = self.compress
+
+		# Chunks are written in order after being verified, so the
+		# partial file always ends at the last good offset, it is only
+		# resumed when the remote file did not change since
+		partpath = f"{targetpath}.part"
+		infopath = f"{targetpath}.part.info"
+		offset = FileDownload._resume_offset(partpath, infopath, identity)
+		if offset > size:
+			offset = 0
+		start = offset // self._chunk_size
+		if start:
+			self._io.info(f"Resuming {targetpath} from offset {start * self._chunk_size}")
+
+		try:
+			f = open(partpath, "r+b" if start else "wb")
+			with open(infopath, "w") as info:
+				info.write(identity)
+		except OSError as e:
+			raise ShellException(e)
+
+		with f, self._io.progress_bar(f"Downloading {filepath} to {targetpath}") as pb, \
+			ThreadPoolExecutor(max_workers=self._workers) as executor:
+			counter = pb(total=n_chunks)
+			counter.items_completed = start
+			f.seek(start * self._chunk_size)
+			f.truncate()
+			for batch in range(start, n_chunks, self._workers):
+				indexes = range(batch, min(batch + self._workers, n_chunks))
+				fetch = lambda index: self._fetch_chunk(filepath, index, compress)
+				for data in executor.map(fetch, indexes):
+					f.write(data)
+					counter.item_completed()
+				f.flush()
+
+		try:
+			os.replace(partpath, targetpath)
+			os.remove(infopath)
+		except OSError as e:
+			raise ShellException(e)
+		self._io.print_with_color(f"Downloaded file to {targetpath}", "yellow")
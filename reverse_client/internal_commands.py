@@ -2,37 +2,76 @@ import logging
 import os
 import subprocess
 import platform
+import gzip
 import getpass
-from .utils import tokenize
+from .utils import tokenize, unescape
 from base64 import b64encode
 from .exceptions import ShellException, ShellInternalInterrupt
+from .file_transfer import FileUpload, FileDownload
 
-available_commands = ["sendfile", "getfile", "getfileraw"]
+available_commands = ["sendfile", "getfile", "getfileraw", "targets", "all", "on", "connections", "cache", "stats", "bg", "jobs", "kill"]
 
 class InternalCommands():
 
-	def __init__(self, shell_io):
+	def __init__(self, shell_io, connection_controller=None,
+				chunk_size=0, transfer_workers=1, transfer_retries=3,
+				compress=False, session_manager=None, response_cache=None,
+				stats=None, job_manager=None):
 		self._io = shell_io
+		self._job_manager = job_manager
+		self._stats = stats
+		self._response_cache = response_cache
+		self._session_manager = session_manager
+		self._connection_controller = connection_controller
+		self._file_upload = None
+		self._file_download = None
+		if connection_controller is not None:
+			self._file_upload = FileUpload(
+				shell_io, connection_controller,
+				chunk_size, transfer_workers, transfer_retries, compress
+			)
+			self._file_download = FileDownload(
+				shell_io, connection_controller,
+				chunk_size, transfer_workers, transfer_retries, compress
+			)
 
 	def _parse_command(self, command):
 		return tokenize(" ")("\\")(command)
 
 
-	def _sendfile(self, command):
+	def _sendfile(self, command, cwd=None):
 		if len(command) != 3:
 			raise ShellException(f"Expected 2 arguments, got {len(command) - 1}")
 
-		filepath = command[1]
+		filepath = unescape(command[1])
 		targetpath = command[2]
+		upload = self._file_upload
+		try:
+			chunked = (upload is not None and upload.enabled and
+				os.path.getsize(filepath) > upload.chunk_size)
+		except OSError as e:
+			raise ShellException(e)
+
+		if chunked:
+			upload.upload(filepath, unescape(targetpath), cwd)
+			raise ShellInternalInterrupt()
+
 		try:
 			with open(filepath, "rb") as f:
 				data = f.read()
 		except Exception as e:
 			raise ShellException(e)
 		
+		compress = upload is not None and upload.compress
+		if compress:
+			data = gzip.compress(data)
+			decode = "base64 -d | gzip -dc"
+		else:
+			decode = "base64 -d"
+
 		data = b64encode(data)
 		data = data.decode("utf-8")
-		return f"echo {data} | base64 -d > {targetpath}", command[0]
+		return f"echo {data} | {decode} > {targetpath}", command[0]
 
 	def _getfile_raw(self, command):
 		if len(command) != 3:
@@ -42,20 +81,28 @@ class InternalCommands():
 		targetpath = command[2]
 		targetpath = os.path.abspath(targetpath)
 		try:
-			with open(targetpath, "w"):
+			with open(targetpath, "wb"):
 				pass
 		except Exception as e:
 			raise ShellException(e)
 		return f"cat {filepath}", f"{command[0]}:{targetpath}"
 
 
-	def _getfile(self, command):
+	def _getfile(self, command, cwd=None):
 		if len(command) != 3:
 			raise ShellException(f"Expected 2 arguments, got {len(command) - 1}")
 
 		filepath = command[1]
-		targetpath = command[2]
-		targetpath = os.path.abspath(targetpath)
+		targetpath = os.path.abspath(unescape(command[2]))
+
+		download = self._file_download
+		if download is not None and download.enabled:
+			download.download(unescape(filepath), targetpath, cwd)
+			raise ShellInternalInterrupt()
+		if download is not None and download.streaming:
+			download.stream(unescape(filepath), targetpath, cwd)
+			raise ShellInternalInterrupt()
+
 		try:
 			with open(targetpath, "w"):
 				pass
@@ -95,15 +142,123 @@ class InternalCommands():
 			self._io.add_to_external_shell_history(command)
 			raise ShellInternalInterrupt()
 
-	def execute(self, command):
+	def _fan_out(self, command):
+		if self._session_manager is None:
+			raise ShellException("No targets are configured")
+
+		if command[0] == "targets":
+			self._session_manager.print_targets()
+			raise ShellInternalInterrupt()
+
+		if command[0] == "all":
+			_, cmd = command
+			names = None
+		else:
+			_, names, cmd = command
+			names = names.split(",")
+		self._session_manager.fan_out(cmd, names)
+		raise ShellInternalInterrupt()
+
+	def _connections(self, command):
+		controller = self._connection_controller
+		if not hasattr(controller, "connections"):
+			raise ShellException("The connection controller does not accept connections")
+
+		if len(command) == 2:
+			try:
+				connection_id = int(command[1])
+			except ValueError:
+				raise ShellException(f"{command[1]} is not a connection id")
+			controller.select(connection_id)
+			raise ShellInternalInterrupt()
+		if len(command) != 1:
+			raise ShellException(f"Expected at most 1 argument, got {len(command) - 1}")
+
+		connections = controller.connections
+		if not connections:
+			self._io.print("No connections yet")
+		for connection_id, address, active in connections:
+			self._io.print(f"{'*' if active else ' '} {connection_id} -> {address}")
+		raise ShellInternalInterrupt()
+
+	def _cache(self, command):
+		cache = self._response_cache
+		if cache is None:
+			raise ShellException("The response cache is not enabled")
+
+		if command[1:] == ["clear"]:
+			cache.clear()
+			self._io.print("Cleared the response cache")
+			raise ShellInternalInterrupt()
+		if len(command) != 1:
+			raise ShellException("Expected no arguments or clear")
+
+		for (_, cwd, user, cmd), age in cache.entries:
+			self._io.print(f"{age:6.1f}s {user or '-'}:{cwd or '-'} {cmd}")
+		stats = cache.stats
+		self._io.print(f"{stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses")
+		raise ShellInternalInterrupt()
+
+	def _jobs(self, command, cwd=None):
+		if self._job_manager is None:
+			raise ShellException("Jobs are not enabled")
+
+		if command[0] == "bg":
+			_, cmd = command
+			self._job_manager.start(cmd, cwd)
+		elif command[0] == "kill":
+			if len(command) != 2:
+				raise ShellException(f"Expected 1 argument, got {len(command) - 1}")
+			try:
+				job_id = int(command[1])
+			except ValueError:
+				raise ShellException(f"{command[1]} is not a job id")
+			self._job_manager.kill(job_id)
+		else:
+			if len(command) != 1:
+				raise ShellException(f"Expected no arguments, got {len(command) - 1}")
+			self._job_manager.print_jobs()
+		raise ShellInternalInterrupt()
+
+	def _print_stats(self, command):
+		if self._stats is None:
+			raise ShellException("Stats are not enabled")
+		if len(command) != 1:
+			raise ShellException(f"Expected no arguments, got {len(command) - 1}")
+
+		for line in self._stats.summary():
+			self._io.print(line)
+		raise ShellInternalInterrupt()
+
+	def execute(self, command, cwd=None):
 		command = command[1:].strip()
+		raw_command = command
 		command = self._parse_command(command)
-		if command[0].startswith("sendfile"):
-			return self._sendfile(command)
+		if command[0] in ["targets", "all", "on"]:
+			n_args = {"targets": 1, "all": 2, "on": 3}[command[0]]
+			raw_command = raw_command.split(None, n_args - 1)
+			if len(raw_command) != n_args:
+				raise ShellException(f"Expected {n_args - 1} arguments, got {len(raw_command) - 1}")
+			return self._fan_out(raw_command)
+		elif command[0] == "bg":
+			raw_command = raw_command.split(None, 1)
+			if len(raw_command) != 2:
+				raise ShellException("Expected a command to run in the background")
+			return self._jobs(raw_command, cwd)
+		elif command[0] in ["jobs", "kill"]:
+			return self._jobs(command, cwd)
+		elif command[0] == "stats":
+			return self._print_stats(command)
+		elif command[0] == "cache":
+			return self._cache(command)
+		elif command[0] == "connections":
+			return self._connections(command)
+		elif command[0].startswith("sendfile"):
+			return self._sendfile(command, cwd)
 		elif command[0].startswith("getfileraw"):
-			return self._getfile(command)
+			return self._getfile_raw(command)
 		elif command[0].startswith("getfile"):
-			return self._getfile(command)
+			return self._getfile(command, cwd)
 		elif command[0].startswith("!"):
 			return self._run_command()
 		raise NotImplementedError("No such command")
\ No newline at end of file
@@ -0,0 +1,179 @@
+import codecs
+from uuid import uuid4
+from shlex import quote
+from threading import Thread, Lock, Event
+from collections import OrderedDict
+from .exceptions import ShellException
+
+
+class Job():
+
+	def __init__(self, job_id, command, path, decode_errors="replace"):
+		self.id = job_id
+		self.command = command
+		self.path = path
+		self.offset = 0
+		self.state = "running"
+		self.exit_code = None
+		self.decoder = codecs.getincrementaldecoder("utf-8")(errors=decode_errors)
+
+
+class JobManager():
+
+	def __init__(self, shell_io, connection_controller,
+				poll_interval=1, directory="/tmp", decode_errors="replace"):
+		self._io = shell_io
+		self._connection_controller = connection_controller
+		self._poll_interval = poll_interval
+		self._directory = directory
+		self._decode_errors = decode_errors
+
+		self._lock = Lock()
+		self._jobs = OrderedDict()
+		self._next_id = 1
+		self._wakeup = Event()
+		self._thread = None
+
+	@property
+	def jobs(self):
+		with self._lock:
+			return list(self._jobs.values())
+
+	def _get(self, job_id):
+		with self._lock:
+			job = self._jobs.get(job_id)
+		if job is None:
+			raise ShellException(f"No job with id {job_id}")
+		return job
+
+	def start(self, cmd, cwd=None):
+		# Jobs start from the shell so that a stateful one passes its
+		# environment on, polling them does not need it
+		path = f"{self._directory}/.job-{uuid4().hex}"
+		cd = f"cd {cwd} && " if cwd is not None else ""
+		# The job writes its pid first and its exit code last, its own
+		# session lets :kill reach the processes it started, the command
+		# runs in a subshell so that an exit in it still gets there
+		script = (
+			f"echo $$ > {path}/pid; ( {cd}{cmd}\n) </dev/null >>{path}/out 2>&1; "
+			f"echo $? > {path}/exit"
+		)
+		try:
+			self._connection_controller.request_output(
+				f"mkdir -m 700 {path} && : > {path}/out && "
+				f"{{ if command -v setsid >/dev/null 2>&1; then setsid sh -c {quote(script)}; "
+				f"else nohup sh -c {quote(script)}; fi >/dev/null 2>&1 </dev/null & }}"
+			)
+		except ConnectionError as e:
+			raise ShellException(f"Could not start the job: {e}")
+
+		with self._lock:
+			job = Job(self._next_id, cmd, path, self._decode_errors)
+			self._jobs[job.id] = job
+			self._next_id += 1
+			self._wakeup.set()
+			if self._thread is None:
+				self._thread = Thread(target=self._poll_thread, daemon=True)
+				self._thread.start()
+		self._io.print_with_color(f"[job {job.id}] started {cmd}", "yellow")
+		return job
+
+	def _poll(self, job):
+		# The exit code is read before the output so that once it is
+		# there the output read after it is complete, the job is checked
+		# to be alive before both since it writes its exit code before
+		# exiting, a job gone without one was killed on the target
+		marker = f"JOB-EXIT-{job.id}:"
+		lost_marker = f"JOB-LOST-{job.id}"
+		output, _ = self._connection_controller.stateless.request_raw_output(
+			f"p=$(cat {job.path}/pid 2>/dev/null); l=; [ -z \"$p\" ] || kill -0 $p 2>/dev/null || l=1; "
+			f"e=$(cat {job.path}/exit 2>/dev/null); tail -c +{job.offset + 1} {job.path}/out; "
+			f"if [ -n \"$e\" ]; then printf '\\n%s%s\\n' {marker} \"$e\"; "
+			f"elif [ -n \"$l\" ]; then printf '\\n%s\\n' {lost_marker}; fi"
+		)
+
+		exit_code = None
+		lost = False
+		end = output.rfind(f"\n{marker}".encode("utf-8"))
+		if end != -1:
+			exit_code = output[end + len(marker) + 1:].strip().decode("utf-8", errors="replace")
+			output = output[:end]
+		elif output.rstrip().endswith(f"\n{lost_marker}".encode("utf-8")):
+			lost = True
+			output = output[:output.rfind(f"\n{lost_marker}".encode("utf-8"))]
+		job.offset += len(output)
+
+		try:
+			text = job.decoder.decode(output, final=exit_code is not None or lost)
+		except UnicodeDecodeError as e:
+			self._io.warning(f"Could not decode the output of job {job.id}: {e}")
+			job.decoder.reset()
+			text = output.decode("utf-8", errors="backslashreplace")
+		if text:
+			self._io.print_with_color(f"[job {job.id}]", "blue")
+			self._io.print_ansi(text, end="" if text.endswith("\n") else "\n")
+		return exit_code, lost
+
+	def _finish(self, job, state, exit_code=None):
+		# The poll thread and :kill both finish jobs, only the first one
+		# sets the state
+		with self._lock:
+			if job.state != "running":
+				return False
+			job.state = state
+			job.exit_code = exit_code
+		self._remove(job)
+		return True
+
+	def _remove(self, job):
+		try:
+			self._connection_controller.stateless.request_output(f"rm -rf {job.path}")
+		except ConnectionError as e:
+			self._io.debug(f"Could not remove {job.path}: {e}")
+
+	def _poll_thread(self):
+		while True:
+			self._wakeup.wait(self._poll_interval)
+			self._wakeup.clear()
+			for job in self.jobs:
+				if job.state != "running":
+					continue
+				try:
+					exit_code, lost = self._poll(job)
+				except ConnectionError as e:
+					self._io.debug(f"Could not poll job {job.id}: {e}")
+					continue
+				if lost:
+					if self._finish(job, "lost"):
+						self._io.print_with_color(f"[job {job.id}] lost, it exited without an exit code", "red")
+				elif exit_code is not None:
+					if self._finish(job, "done", exit_code):
+						color = "yellow" if exit_code == "0" else "red"
+						self._io.print_with_color(f"[job {job.id}] exited with {exit_code}", color)
+
+	def kill(self, job_id):
+		job = self._get(job_id)
+		# The job is marked killed before it is, so that the poll thread
+		# does not report it as lost or done in between
+		with self._lock:
+			if job.state != "running":
+				raise ShellException(f"Job {job_id} is not running")
+			job.state = "killed"
+		# Killing the process group takes the children along, without
+		# setsid only the job shell itself is there to kill
+		try:
+			self._connection_controller.stateless.request_raw_output(
+				f"p=$(cat {job.path}/pid 2>/dev/null) && "
+				f"{{ kill -TERM -$p 2>/dev/null || kill -TERM $p; }}"
+			)
+		except ConnectionError as e:
+			with self._lock:
+				job.state = "running"
+			raise ShellException(f"Could not kill job {job_id}: {e}")
+		self._remove(job)
+		self._io.print_with_color(f"[job {job_id}] killed", "yellow")
+
+	def print_jobs(self):
+		for job in self.jobs:
+			state = job.state if job.exit_code is None else f"{job.state} ({job.exit_code})"
+			self._io.print(f"{job.id} {state} {job.offset} bytes {job.command}")
@@ -6,6 +6,9 @@ from prompt_toolkit import print_formatted_text as original_print_formatted_text
 class _ThreadCtx():
     loop = get_event_loop()
 
+def use_event_loop(loop):
+    _ThreadCtx.loop = loop
+
 def print_formatted_text(*args, **kwargs):
 
     loop = _ThreadCtx.loop
@@ -16,7 +19,9 @@ def print_formatted_text(*args, **kwargs):
     def _run_in_terminal():
         run_in_terminal(_print_formatted_text, in_executor=False)
 
-    if main_thread() == current_thread():
+    # prompt_toolkit already prints above a running application from
+    # any thread, the loop is only needed when it is actually running
+    if main_thread() == current_thread() or not loop.is_running():
         _print_formatted_text()
     else:
         loop.call_soon_threadsafe(_run_in_terminal)
\ No newline at end of file
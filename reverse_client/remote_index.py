@@ -0,0 +1,83 @@
+import time
+from shlex import quote
+from threading import Lock
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RemoteIndex():
+
+	_executables_key = "$PATH"
+
+	def __init__(self, shell_io, connection_controller, ttl=30, max_entries=128):
+		self._io = shell_io
+		self._connection_controller = connection_controller
+		self._ttl = ttl
+		self._max_entries = max_entries
+
+		self._lock = Lock()
+		self._entries = OrderedDict()
+		self._pending = {}
+		self._executor = ThreadPoolExecutor(max_workers=1)
+
+	def _list(self, key):
+		if key == RemoteIndex._executables_key:
+			cmd = 'IFS=:; for d in $PATH; do ls -1 "$d" 2>/dev/null; done | sort -u'
+		else:
+			cmd = f"ls -1ap {quote(key)} 2>/dev/null"
+		output = self._connection_controller.request_output(cmd)
+		return [entry for entry in output.split("\n") if entry not in ["", "./", "../"]]
+
+	def _fetch(self, key):
+		try:
+			entries = self._list(key)
+		except Exception as e:
+			self._io.debug(f"Could not list {key}: {e}")
+			entries = None
+
+		with self._lock:
+			self._pending.pop(key, None)
+			if entries is None:
+				return None
+			self._entries[key] = (time.monotonic(), entries)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+		return entries
+
+	def _cached(self, key):
+		cached = self._entries.get(key)
+		if cached is None:
+			return None
+		timestamp, entries = cached
+		if time.monotonic() - timestamp > self._ttl:
+			del self._entries[key]
+			return None
+		self._entries.move_to_end(key)
+		return entries
+
+	def _submit(self, key):
+		future = self._pending.get(key)
+		if future is None:
+			future = self._executor.submit(self._fetch, key)
+			self._pending[key] = future
+		return future
+
+	def prefetch(self, key):
+		with self._lock:
+			if self._cached(key) is None:
+				self._submit(key)
+
+	def get(self, key):
+		with self._lock:
+			entries = self._cached(key)
+			if entries is not None:
+				return entries
+			future = self._submit(key)
+		return future.result() or []
+
+	def prefetch_executables(self):
+		self.prefetch(RemoteIndex._executables_key)
+
+	def executables(self):
+		return self.get(RemoteIndex._executables_key)
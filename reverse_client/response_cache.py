@@ -0,0 +1,119 @@
+import time
+from threading import Lock
+from collections import OrderedDict
+from .utils import tokenize
+
+# Commands that only read state, a command is cached when every part of
+# it starts with one of them and nothing is redirected or substituted
+read_only_commands = {
+	"ls", "ll", "la", "cat", "id", "whoami", "groups", "uname", "hostname",
+	"pwd", "ps", "df", "du", "free", "uptime", "w", "who", "last", "env",
+	"printenv", "stat", "file", "grep", "egrep", "fgrep", "head", "tail",
+	"wc", "which", "echo", "getent", "lsblk", "ip", "ifconfig", "netstat",
+	"ss", "sort", "uniq", "cut", "readlink", "realpath", "basename",
+	"dirname", "md5sum", "sha1sum", "sha256sum", "base64", "strings",
+	"od", "tree", "date"
+}
+
+_unsafe_tokens = [">", "`", "$(", "<("]
+
+# Commands that change the target when given arguments (env runs one,
+# hostname and date set theirs, ifconfig configures an interface)
+_bare_commands = {"env", "hostname", "date", "ifconfig"}
+
+_ip_objects = {"a", "addr", "address", "l", "link", "r", "route", "n", "neigh", "rule"}
+_ip_actions = {"show", "list", "ls", "get"}
+
+
+def _read_only_arguments(words):
+	name, args = words[0], words[1:]
+	if name in _bare_commands:
+		return not args or (name == "ifconfig" and args == ["-a"])
+	if name == "ip":
+		args = [arg for arg in args if not arg.startswith("-")]
+		return (len(args) >= 1 and args[0] in _ip_objects and
+			(len(args) == 1 or args[1] in _ip_actions))
+	if name == "sort":
+		# -o may sit in a cluster of short options
+		return not any(arg.startswith("--output") or
+			(arg.startswith("-") and not arg.startswith("--") and "o" in arg) for arg in args)
+	if name == "uniq":
+		# uniq IN OUT writes OUT
+		return len([arg for arg in args if not arg.startswith("-")]) <= 1
+	return True
+
+
+def is_read_only(cmd):
+	if any(token in cmd for token in _unsafe_tokens):
+		return False
+
+	for part in tokenize("&&", "||", ";", "|")("\\")(cmd):
+		words = part.split()
+		if not words or words[0] not in read_only_commands:
+			return False
+		if not _read_only_arguments(words):
+			return False
+	return True
+
+
+class ResponseCache():
+
+	def __init__(self, ttl=60, max_entries=256):
+		self._ttl = ttl
+		self._max_entries = max_entries
+
+		self._lock = Lock()
+		self._entries = OrderedDict()
+		self._generation = 0
+		self._hits = 0
+		self._misses = 0
+
+	@property
+	def generation(self):
+		# Keys carry the generation so that responses of requests sent
+		# before a clear are never found after it
+		return self._generation
+
+	@property
+	def stats(self):
+		with self._lock:
+			return {
+				"entries": len(self._entries),
+				"hits": self._hits,
+				"misses": self._misses
+			}
+
+	@property
+	def entries(self):
+		now = time.monotonic()
+		with self._lock:
+			return [
+				(key, now - timestamp)
+				for key, (timestamp, _) in self._entries.items()
+				if now - timestamp <= self._ttl
+			]
+
+	def get(self, key):
+		with self._lock:
+			cached = self._entries.get(key)
+			if cached is not None and time.monotonic() - cached[0] > self._ttl:
+				del self._entries[key]
+				cached = None
+			if cached is None:
+				self._misses += 1
+				return None
+			self._hits += 1
+			self._entries.move_to_end(key)
+			return cached[1]
+
+	def put(self, key, response):
+		with self._lock:
+			self._entries[key] = (time.monotonic(), response)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._generation += 1
+			self._entries.clear()
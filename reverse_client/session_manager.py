@@ -0,0 +1,85 @@
+import asyncio
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from .exceptions import ShellException, ShellInternalInterrupt
+
+
+class SessionManager():
+
+	def __init__(self, shell_io):
+		self._io = shell_io
+		self._shells = {}
+		self._loop = None
+
+	@property
+	def targets(self):
+		return list(self._shells)
+
+	def _get_loop(self):
+		# Async controllers of the secondary targets live on a loop of
+		# their own so that their blocking request works from any thread
+		if self._loop is None:
+			self._loop = asyncio.new_event_loop()
+			Thread(target=self._loop.run_forever, daemon=True).start()
+		return self._loop
+
+	def add(self, name, shell, primary=False):
+		if name in self._shells:
+			raise ShellException(f"Target {name} already exists")
+
+		controller = shell.connection_controller
+		if controller.asynchronous and not primary:
+			asyncio.run_coroutine_threadsafe(controller.open(), self._get_loop()).result()
+		self._shells[name] = shell
+		return self
+
+	def pre_start(self, names):
+		with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+			for name in names:
+				executor.submit(self._shells[name]._pre_start)
+
+	def _run(self, name, cmd):
+		try:
+			return self._shells[name].run(cmd)
+		except ShellInternalInterrupt:
+			return None, None
+		except (ShellException, NotImplementedError, ConnectionError) as e:
+			return None, e
+
+	def fan_out(self, cmd, names=None):
+		if cmd.strip().startswith(":"):
+			raise ShellException("Internal commands can not be sent to multiple targets")
+
+		names = self.targets if names is None else names
+		unknown = [name for name in names if name not in self._shells]
+		if unknown:
+			raise ShellException(f"Unknown targets: {', '.join(unknown)}")
+
+		with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+			results = executor.map(lambda name: self._run(name, cmd), names)
+			results = dict(zip(names, results))
+
+		io = self._io
+		for name, (output, result) in results.items():
+			io.print_with_color(f"[{name}]", "blue")
+			if isinstance(result, Exception):
+				io.error(result)
+				continue
+			if output:
+				print(output)
+			if result not in [None, "0"]:
+				io.warning(f"Command returned an exit code {result}")
+		return results
+
+	def print_targets(self):
+		for name, shell in self._shells.items():
+			self._io.print(f"{name} -> {shell.uri}")
+
+	def close(self):
+		for shell in self._shells.values():
+			try:
+				shell.connection_controller.close()
+			except Exception as e:
+				self._io.debug(e)
+		if self._loop is not None:
+			self._loop.call_soon_threadsafe(self._loop.stop)
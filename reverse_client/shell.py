@@ -1,9 +1,14 @@
 import os
 import sys
+import asyncio
 import traceback
 from enum import Enum
 from base64 import b64decode
+from uuid import uuid4
+from .utils import compress_command, decompress_output, frame_command, parse_framed_output
 from .exceptions import ShellException, ShellInternalInterrupt
+from .command_pipeline import CommandPipeline
+from .response_cache import is_read_only
 from .connection_controller.exceptions import (
 	RequestError, 
 	TorConnectionError,
@@ -11,6 +16,20 @@ from .connection_controller.exceptions import (
 	SocketConnectionError
 )
 
+_probe_marker = "PROBE-SECTION:"
+_probe_sections = {
+	"user": "whoami",
+	"hostname": "hostname 2>/dev/null || uname -n",
+	"cwd": "pwd",
+	"shell": "echo $SHELL",
+	"path": "echo $PATH",
+	"os": "uname -a"
+}
+# Collects every section in one request, ; keeps it a single command in virtual mode
+_probe_command = "; ".join(
+	f"echo {_probe_marker}{name}; {cmd}" for name, cmd in _probe_sections.items()
+)
+
 class Shell():
 
 	_default_aliases = {
@@ -44,7 +63,13 @@ class Shell():
 				last_line,
 				io,
 				connection_controller,
-				internal_commands):
+				internal_commands,
+				compress=False,
+				remote_index=None,
+				pipeline_workers=1,
+				response_cache=None,
+				stats=None,
+				decode_errors="replace"):
 
 		io.info("Shell: Initiating")		
 		self._uri = uri
@@ -52,10 +77,18 @@ class Shell():
 		self._io = io
 		self._connection_controller = connection_controller
 		self._internal_commands = internal_commands
+		self._compress = compress
+		self._remote_index = remote_index
+		self._response_cache = response_cache
+		self._stats = stats
+		self._decode_errors = decode_errors
+		# Unique per session so that no command output is taken for a sentinel
+		self._frame_id = uuid4().hex
 
 		self._user = None
 		self._hostname = None
 		self._cwd = None
+		self._remote_info = {}
 		self._reset()
 
 		if connection_controller.interactive:
@@ -65,6 +98,13 @@ class Shell():
 
 		self._aliases = Shell._default_aliases
 
+		# Commands typed while others are in flight are only pipelined
+		# when their output comes back as the response
+		self._pipeline = None
+		if (pipeline_workers > 1 and self._type != Shell.Type.INTERACTIVE and
+			not connection_controller.asynchronous and not connection_controller.stateful):
+			self._pipeline = CommandPipeline(self, pipeline_workers)
+
 		if self._type == Shell.Type.VIRTUAL_FORCE:
 			io.print(
 				"Setting virtual to force may have unpredicted behaviour, " +
@@ -72,10 +112,22 @@ class Shell():
 			)
 
 
+	@property
+	def uri(self):
+		return self._uri
+
+	@property
+	def connection_controller(self):
+		return self._connection_controller
+
+	@property
+	def cwd(self):
+		return self._cwd
+
 	@property
 	def _input_txt(self):
 		user = self._user or "shell"
-		hostname = f"@{self._user}" if self._user else ""
+		hostname = f"@{self._hostname}" if self._hostname else ""
 		cwd = self._cwd or ""
 
 		if self._user is not None and cwd.startswith(f"/home/{user}"):
@@ -89,10 +141,40 @@ class Shell():
 		)
 
 	def _set_user(self, user):
+		if self._response_cache is not None and user != self._user:
+			self._response_cache.clear()
 		self._user = user
 		return self
 
+	def _set_hostname(self, hostname):
+		self._hostname = hostname
+		return self
+
+	def _set_remote_info(self, probe_output):
+		remote_info = {}
+		section = None
+		for line in probe_output.split("\n"):
+			if line.startswith(_probe_marker):
+				section = line[len(_probe_marker):].strip()
+				remote_info[section] = []
+			elif section is not None:
+				remote_info[section].append(line)
+
+		remote_info = {
+			section: "\n".join(lines).strip() or None
+			for section, lines in remote_info.items()
+		}
+		self._remote_info = remote_info
+		self._set_user(remote_info.get("user"))
+		self._set_hostname(remote_info.get("hostname"))
+		if remote_info.get("cwd") is not None:
+			self._set_cwd(remote_info["cwd"])
+		if self._remote_index is not None:
+			self._remote_index.prefetch_executables()
+		return self
+
 	def _set_cwd(self, new_cwd):
+		old_cwd = self._cwd
 		if os.path.isabs(new_cwd):
 			self._cwd = new_cwd
 		elif self._cwd is not None:
@@ -101,13 +183,20 @@ class Shell():
 			self._cwd = str(new_cwd)
 		else:
 			pass
+
+		if self._response_cache is not None and self._cwd != old_cwd:
+			self._response_cache.clear()
+		if self._remote_index is not None and self._cwd is not None:
+			self._remote_index.prefetch(self._cwd)
 		return self
 
 	def _set_command(self, cmd):
 		self._command = {
 			"real": cmd,
 			"exec": cmd,
-			"exec_no_pipe": cmd
+			"exec_no_pipe": cmd,
+			"framed": False,
+			"compressed": False
 		}
 		return self
 
@@ -122,6 +211,9 @@ class Shell():
 	def _change_directory(self):
 		if self._type not in [Shell.Type.VIRTUAL_ON, Shell.Type.VIRTUAL_FORCE]:
 			return self
+		# A stateful remote shell is already in its working directory
+		if self._connection_controller.stateful:
+			return self
 		cmd = self._command["exec_no_pipe"]
 		if self._cwd is not None:
 			cmd = f"cd {self._cwd} && {cmd}"
@@ -135,8 +227,25 @@ class Shell():
 		self._command["exec"] = cmd
 		return self
 
+	def _frame_output(self):
+		if self._type not in [Shell.Type.VIRTUAL_ON, Shell.Type.VIRTUAL_FORCE]:
+			return self
+		self._command["exec"] = frame_command(self._command["exec"], self._frame_id)
+		self._command["framed"] = True
+		return self
+
+	def _compress_output(self):
+		# The compressed command runs in a subshell, its state would be lost
+		if (not self._compress or self._type == Shell.Type.INTERACTIVE or
+			self._connection_controller.stateful):
+			return self
+		# The session nonce rather than a new one, so that compressed
+		# commands still hit the response cache
+		self._command["exec"] = compress_command(self._command["exec"], self._frame_id)
+		self._command["compressed"] = True
+		return self
 
-	def _get_user_input(self, custom_input=None):
+	def _get_user_input(self, custom_input=None, save_history=True):
 		if custom_input is None:
 			user_input = self._io.shell_input(self._input_txt, save_history=True)
 		else:
@@ -150,9 +259,13 @@ class Shell():
 		if user_input.startswith(":"):
 			if self._type == Shell.Type.VIRTUAL_OFF:
 				raise ShellException("Inernal commands are not enabled when virtual is set to off")
-			cmd, cmd_name = self._internal_commands.execute(user_input)
+			cmd, cmd_name = self._internal_commands.execute(user_input, self._cwd)
 			self._request["internal_command"] = cmd_name
-			return self._set_command(cmd)._change_directory()._redirect_stderr_to_stdout()
+			return (self._set_command(cmd)
+				._change_directory()
+				._redirect_stderr_to_stdout()
+				._frame_output()
+				._compress_output())
 
 		if self._type in [Shell.Type.VIRTUAL_ON, Shell.Type.VIRTUAL_FORCE]:
 			user_input_list = user_input.split("&&")
@@ -160,12 +273,15 @@ class Shell():
 			if len(user_input_list) != 1:
 				self._io.warning(f"Enabling features runs only one command command will be {user_input}")
 
-		self._io.add_to_shell_history(user_input)
+		if save_history:
+			self._io.add_to_shell_history(user_input)
 
 		return (self._set_command(user_input)
 			._make_aliases()
 			._change_directory()
-			._redirect_stderr_to_stdout())
+			._redirect_stderr_to_stdout()
+			._frame_output()
+			._compress_output())
 
 	def _should_make_request(self):
 		real_cmd = self._command["real"]
@@ -177,7 +293,7 @@ class Shell():
 		self._request["skipped"] = not make_request
 		return make_request
 
-	def _make_request(self):
+	def _prepare_request(self):
 		cmd = self._command["exec"]
 		real_cmd = self._command["real"]
 
@@ -189,18 +305,76 @@ class Shell():
 
 		if not self._should_make_request():
 			self._io.debug(f"Not making request with cmd: {real_cmd}")
-			return self
+			return None
 
 		self._io.info(f"Exec Command -> {cmd}")
+		return cmd
+
+	def _cache_lookup(self):
+		cache = self._response_cache
+		if cache is None:
+			return None, None
+		if (self._request["internal_command"] is not None or
+			not is_read_only(self._command["real"])):
+			# Anything but a read only command may change the remote
+			cache.clear()
+			return None, None
+
+		key = (cache.generation, self._cwd, self._user, self._command["exec"])
+		return key, cache.get(key)
+
+	def _cache_store(self, key, response):
+		if key is not None and response[1] == 200:
+			self._response_cache.put(key, response)
+
+	def _make_request(self):
+		cmd = self._prepare_request()
+		if cmd is None:
+			return self
 
 		if self._type == Shell.Type.INTERACTIVE:
 			self._connection_controller.request(cmd)
 			raise ShellInternalInterrupt()
-		else:
-			data, status = self._connection_controller.request(cmd)
 
+		key, cached = self._cache_lookup()
+		if cached is not None:
+			self._io.debug(f"Using the cached response of {cmd}")
+			return self._set_response(*cached)
+
+		data, status = self._connection_controller.request(cmd)
+		self._cache_store(key, (data, status))
+		return self._set_response(data, status)
+
+	async def _make_request_async(self):
+		cmd = self._prepare_request()
+		if cmd is None:
+			return self
+
+		if self._type == Shell.Type.INTERACTIVE:
+			await self._connection_controller.request_async(cmd)
+			raise ShellInternalInterrupt()
+
+		key, cached = self._cache_lookup()
+		if cached is not None:
+			self._io.debug(f"Using the cached response of {cmd}")
+			return self._set_response(*cached)
+
+		data, status = await self._connection_controller.request_async(cmd)
+		self._cache_store(key, (data, status))
+		return self._set_response(data, status)
+
+	def _decode(self, data):
+		# Responses are bytes until they are shown or parsed
+		if data is None or isinstance(data, str):
+			return data
+		try:
+			return data.decode("utf-8", errors=self._decode_errors)
+		except UnicodeDecodeError as e:
+			raise ShellException(f"Could not decode the response: {e}")
+
+	def _set_response(self, data, status):
 		if status != 200:
-			self._io.print(f"Data: {data}")
+			self._io.print(f"Data: {self._decode(data)}")
 			self._io.error(f"Status_code: {status}")
 
 		self._request["response"] = {
@@ -214,20 +388,19 @@ class Shell():
 		cmd_name = self._request["internal_command"] 
 		if cmd_name.startswith("sendfile"):
 			self._request["internal_command"] = None
-			return self._process_response()
+			return self._parse_response()
 		
-		if self._last_line == "command-result" and self._request["command_result"] != "0":
+		command_result = self._request["command_result"]
+		if command_result not in [None, "0"]:
 			raise ShellException(f"Command returned with an exit code {command_result}")
 
 		if cmd_name.startswith("getfile"):
 			targetpath = cmd_name.split(":")[-1]
-			if cmd_name.startswith("getfileraw"):
-				mode, b64 = "w", False
-			else:
-				mode, b64 = "wb", True
+			# Raw pulls come back byte for byte, without base64
+			b64 = not cmd_name.startswith("getfileraw")
 			try:
 				data = b64decode(self._request["command_output"]) if b64 else self._request["command_output"]
-				with open(targetpath, mode) as f:
+				with open(targetpath, "wb") as f:
 					f.write(data)
 
 				io = self._io
@@ -243,32 +416,45 @@ class Shell():
 
 
 	def _process_response(self, force=False):
+		if self._stats is None:
+			return self._parse_response(force)
+		# Client side time, the request itself is timed by the controller
+		with self._stats.timer("process"):
+			return self._parse_response(force)
+
+	def _parse_response(self, force=False):
 		if self._request["response"] is None:
 			if not self._request["skipped"]:
 				raise ShellException("Response is None")
 			return self
 
 		response_content = self._request["response"]["data"]
-		response_content = response_content.split("\n")
-		response_content = list(response_content)		
-
-		if self._type not in [Shell.Type.INTERACTIVE, Shell.Type.VIRTUAL_ON, Shell.Type.VIRTUAL_FORCE]:
-			command_output = "\n".join(response_content)
-			self._request["command_output"] = command_output
-			return self
+		if self._command["compressed"]:
+			response_content = decompress_output(response_content, self._frame_id)
+
+		command_output = None
+		if self._command["framed"]:
+			# Without the end sentinel the exit code is unknown, the
+			# output after the start one is still all there is
+			raw = (self._request["internal_command"] or "").startswith("getfileraw")
+			command_output, command_result = parse_framed_output(
+				response_content, self._frame_id, strip_newline=not raw
+			)
 
-		if self._last_line == "command":
-			command_output = "\n".join(response_content)
-			command_result = None
-		elif self._last_line == "command-result":
-			command_output = response_content[:-1]
-			command_output = "\n".join(command_output)
-			try:
-				command_result = response_content[-1]
-			except IndexError:
+		if command_output is None:
+			if self._type not in [Shell.Type.INTERACTIVE, Shell.Type.VIRTUAL_ON, Shell.Type.VIRTUAL_FORCE]:
+				self._request["command_output"] = response_content
+				return self
+			elif self._last_line == "command":
+				command_output = response_content
 				command_result = None
-		else:
-			raise NotImplementedError(f"{self._last_line} parsing is not implemented")
+			elif self._last_line == "command-result":
+				# Without sentinels the webshell is expected to print the exit code last
+				last_line = response_content.rfind(b"\n")
+				command_output = response_content[:max(last_line, 0)]
+				command_result = self._decode(response_content[last_line + 1:])
+			else:
+				raise NotImplementedError(f"{self._last_line} parsing is not implemented")
 
 		self._request["command_output"] = command_output
 		self._request["command_result"] = command_result
@@ -277,13 +463,17 @@ class Shell():
 			self._process_internal_command_response()
 			return self
 
-		if self._last_line == "command" and self._type == Shell.Type.VIRTUAL_ON:
+		# Without an exit code there is no telling whether the command worked
+		if command_result is None and self._type == Shell.Type.VIRTUAL_ON:
 			return self
 
-		if self._type != Shell.Type.INTERACTIVE and command_result != "0" and not force:
-			self._io.error(f"Command returned a non zero exit code {command_result}")
+		# force only keeps the error quiet, a failed cd or su must not
+		# change the state either way
+		if self._type != Shell.Type.INTERACTIVE and command_result != "0":
+			if not force:
+				self._io.error(f"Command returned a non zero exit code {command_result}")
 			return self
-		if not force and command_result != None:
+		if not force and command_result not in [None, "0"]:
 			self._io.warning(f"Command returned an exit code {command_result}")	
 
 		cmd = self._command["real"]
@@ -291,13 +481,15 @@ class Shell():
 		if cmd.startswith("su "):
 			self._set_user(None)
 		elif cmd == "whoami":
-			self._set_user(command_output)
+			self._set_user(self._decode(command_output))
 		elif cmd.startswith("cd "):
 			directory = cmd.replace("cd ", "", 1)
 			directory = directory.strip()
 			self._set_cwd(directory)
 		elif cmd == "pwd":
-			self._set_cwd(command_output)
+			self._set_cwd(self._decode(command_output))
+		elif cmd == _probe_command:
+			self._set_remote_info(self._decode(command_output))
 		
 
 		return self
@@ -322,16 +514,27 @@ class Shell():
 		command_result = self._request["command_result"]
 		
 		if command_output:
-			print(command_output)
+			print(self._decode(command_output))
 		elif command_result != "0":
 			self._io.error("Response content is empty")
 		return self
 
+	def _snapshot(self):
+		return dict(self._command), dict(self._request)
+
+	def _restore(self, snapshot):
+		command, request = snapshot
+		self._command = dict(command)
+		self._request = dict(request)
+		return self
+
 	def _reset(self):
 		self._command = {
 			"real": None,
 			"exec": None,
-			"exec_no_pipe": None
+			"exec_no_pipe": None,
+			"framed": False,
+			"compressed": False
 		}
 		self._request = {
 			"command_output": None,
@@ -358,22 +561,30 @@ class Shell():
 		
 
 	def _exit(self):
+		if self._pipeline is not None:
+			self._pipeline.close()
 		self._connection_controller.close()	
 		sys.exit()
 
+	async def _exit_async(self):
+		await self._connection_controller.close_async()
+		sys.exit()
 
-	def _pre_start(self):
+	def _pre_commands(self):
+		# Interactive shells print the output themselves, so there is
+		# nothing to parse and nothing to wait for
+		if self._type == Shell.Type.INTERACTIVE:
+			return ["whoami", "pwd"]
+		# Framed responses carry the exit code, whatever last-line is
+		if self._type in [Shell.Type.VIRTUAL_ON, Shell.Type.VIRTUAL_FORCE]:
+			return [_probe_command]
+		return []
 
-		if (self._type in [Shell.Type.INTERACTIVE, Shell.Type.VIRTUAL_FORCE] 
-			or (self._type == Shell.Type.VIRTUAL_ON and
-				self._last_line == "command-result")):
-			pre_commands = ["whoami", "pwd"]
-		else:
-			pre_commands = []
+	def _pre_start(self):
 
-		for pre_command in pre_commands:
+		for pre_command in self._pre_commands():
 			try:
-				(self._get_user_input(pre_command)
+				(self._get_user_input(pre_command, save_history=False)
 				._make_request()
 				._process_response(force=True)
 				._reset())
@@ -399,8 +610,93 @@ class Shell():
 				self._reset()
 		return True
 
+	def run(self, cmd):
+		try:
+			# Commands fanned out to targets stay out of the prompt history
+			(self._get_user_input(cmd, save_history=False)
+				._make_request()
+				._process_response(force=True))
+			return self._decode(self._request["command_output"]), self._request["command_result"]
+		finally:
+			self._reset()
+
+	async def _pre_start_async(self):
+
+		for pre_command in self._pre_commands():
+			try:
+				await asyncio.to_thread(self._get_user_input, pre_command, False)
+				(await self._make_request_async())._process_response(force=True)
+			except ShellInternalInterrupt:
+				pass
+			except (ShellException, NotImplementedError) as e:
+				self._io.error(e)
+			except TorConnectionError as e:
+				self._io.error(e)
+			except RequestError as e:
+				self._io.error(e)
+			except SocketConnectionError as e:
+				self._io.error(e)
+			except Exception as e:
+				traceback.print_exc()
+				should_exit = await asyncio.to_thread(
+					self._prompt_exit,
+					f"Got an exception do you want to quit? (Y/n)> ",
+					"error"
+				)
+				if should_exit:
+					return False
+			finally:
+				self._reset()
+		return True
+
+	async def _start_async(self):
+		from .print_formatted_text import use_event_loop
+
+		await self._connection_controller.open()
+		# Output from worker threads is scheduled on this loop
+		use_event_loop(asyncio.get_running_loop())
+
+		if self._type == Shell.Type.INTERACTIVE:
+			pass
+		elif not await self._pre_start_async():
+			return await self._exit_async()
+
+		while True:
+			try:
+				user_input = await self._io.shell_input_async(self._input_txt)
+				# Internal commands may block on transfers or local prompts
+				await asyncio.to_thread(self._get_user_input, user_input)
+				(await self._make_request_async())._process_response()._print_response()
+
+			except ShellInternalInterrupt:
+				pass
+			except (ShellException, NotImplementedError) as e:
+				self._io.error(e)
+			except RequestError as e:
+				self._io.error(e)
+			except TorConnectionError as e:
+				self._io.error(e)
+			except SocketConnectionError as e:
+				self._io.error(e)
+			except KeyboardInterrupt:
+				return await self._exit_async()
+			except Exception as e:
+				traceback.print_exc()
+				yes = await asyncio.to_thread(
+					self._prompt_exit,
+					f"Got an exception do you want to quit? (Y/n)> ",
+					"error"
+				)
+				if yes:
+					return await self._exit_async()
+			finally:
+				self._reset()
+
 	def start(self):
 
+		if self._connection_controller.asynchronous:
+			return asyncio.run(self._start_async())
+
 		if self._type == Shell.Type.INTERACTIVE:
 			pass
 		elif not self._pre_start():
@@ -408,6 +704,10 @@ class Shell():
 
 		while True:
 			try:
+				if self._pipeline is not None:
+					self._pipeline.submit(self._io.shell_input(self._input_txt, save_history=True))
+					continue
+
 				(self._get_user_input()
 					._make_request()
 					._process_response()
@@ -443,4 +743,6 @@ class Shell():
 					self._connection_controller.close()
 					return self._exit()
 			finally:
-				self._reset()
\ No newline at end of file
+				# The pipeline resets the shell itself once a response is printed
+				if self._pipeline is None:
+					self._reset()
\ No newline at end of file
@@ -2,9 +2,8 @@
 from prompt_toolkit import PromptSession
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit.history import InMemoryHistory
-from prompt_toolkit.shortcuts import CompleteStyle, prompt, clear
+from prompt_toolkit.shortcuts import CompleteStyle, ProgressBar, prompt, clear
 from prompt_toolkit.lexers import PygmentsLexer
-from pygments.lexers.shell import BashLexer
 from prompt_toolkit import HTML, ANSI#, print_formatted_text
 from prompt_toolkit.output.color_depth import ColorDepth
 from prompt_toolkit.styles import Style
@@ -12,11 +11,14 @@ from prompt_toolkit.application import run_in_terminal
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.patch_stdout import patch_stdout
 import logging
+from threading import Lock
+from functools import cached_property
 from .print_formatted_text import print_formatted_text
 from .utils import tokenize, html_escape_decorator
 from .internal_commands import available_commands
 from .exceptions import ShellException, ShellInternalInterrupt
-from .autocompleters import InternalCommandsCompleter, ShellAutocompleter
+from prompt_toolkit.completion import ThreadedCompleter, merge_completers
+from .autocompleters import InternalCommandsCompleter, ShellAutocompleter, RemoteCompleter
 
 styles_dict = {
     'blue': '#2880fc',
@@ -43,28 +45,55 @@ class ShellIO():
         external_shell_history = InMemoryHistory()
         self._external_shell_history = external_shell_history
 
-        self._shell_session = PromptSession(
-            history=shell_history,
-            auto_suggest=AutoSuggestFromHistory(),
-            enable_history_search=True,
-            completer=InternalCommandsCompleter(),
-            lexer=PygmentsLexer(BashLexer),
-            complete_style=CompleteStyle.READLINE_LIKE,
-            color_depth=ColorDepth.TRUE_COLOR
-        )
+        self._bindings = self._get_bindings()
+
+        self._prompt_lock = Lock()
+        self._prompt_message = None
 
-        self._external_shell_session = PromptSession(
-            history=external_shell_history,
+    @classmethod
+    def _new_session(cls, history, completer):
+        # pygments is only loaded once a prompt is shown
+        from pygments.lexers.shell import BashLexer
+        return PromptSession(
+            history=history,
             auto_suggest=AutoSuggestFromHistory(),
             enable_history_search=True,
-            completer=ShellAutocompleter(),
+            completer=completer,
             lexer=PygmentsLexer(BashLexer),
             complete_style=CompleteStyle.READLINE_LIKE,
             color_depth=ColorDepth.TRUE_COLOR
         )
 
-        self._bindings = self._get_bindings()
-
+    @cached_property
+    def _shell_session(self):
+        session = ShellIO._new_session(self._shell_history, InternalCommandsCompleter())
+        with self._prompt_lock:
+            if self._prompt_message is not None:
+                session.message = self._prompt_message
+        return session
+
+    @cached_property
+    def _external_shell_session(self):
+        return ShellIO._new_session(self._external_shell_history, ShellAutocompleter())
+
+    def set_prompt(self, txt):
+        # Called from the socket threads, the prompt session is left for
+        # the main thread to create and picks the prompt up then
+        with self._prompt_lock:
+            self._prompt_message = txt
+            session = self.__dict__.get("_shell_session")
+            if session is None:
+                return
+            session.message = txt
+        session.app.invalidate()
+
+    def set_remote_completer(self, remote_index, get_cwd):
+        # Listing a remote directory may take a round trip, complete in
+        # a thread so that the prompt stays responsive
+        self._shell_session.completer = merge_completers([
+            InternalCommandsCompleter(),
+            ThreadedCompleter(RemoteCompleter(remote_index, get_cwd))
+        ])
 
     def _get_bindings(self):
         bindings = KeyBindings()
@@ -105,6 +134,18 @@ class ShellIO():
             return self.shell_input(txt, save_history, valid_input)
         return inpt
 
+    async def shell_input_async(self, txt, save_history=True, valid_input=None):
+
+        try:
+            with patch_stdout():
+                inpt = await self._shell_session.prompt_async(txt, key_bindings=self._bindings)
+        except EOFError:
+            raise KeyboardInterrupt()
+        valid = valid_input is None or inpt.lower() in map(lambda x: x.lower(), valid_input)
+        if not valid:
+            return await self.shell_input_async(txt, save_history, valid_input)
+        return inpt
+
     def external_shell_input(self, txt, save_history=True):
         try:
             with patch_stdout():
@@ -123,6 +164,9 @@ class ShellIO():
     def text_with_ansi(self, txt):
         return ANSI(txt)
 
+    def print_ansi(self, txt, end="\n"):
+        print_formatted_text(ANSI(txt), end=end)
+
     @html_escape_decorator
     def print(self, txt):
         print_formatted_text(HTML(txt), style=text_styles)
@@ -132,6 +176,10 @@ class ShellIO():
         txt = HTML(f"<{color}>{txt}</{color}>")
         print_formatted_text(txt, style=text_styles)
 
+    @html_escape_decorator
+    def progress_bar(self, txt):
+        return ProgressBar(title=HTML(f"<yellow>{txt}</yellow>"), style=text_styles)
+
     # <aaa fg="ansiwhite" bg="ansigreen">White on green</aaa>
     @classmethod
     @html_escape_decorator
@@ -0,0 +1,233 @@
+import json
+import time
+from math import ceil
+from threading import Lock
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Histogram():
+
+	# Log-linear buckets like HdrHistogram, values below 2 ** bits are
+	# exact and every power of two above them is split in 2 ** bits
+	# buckets, so a value is off by at most 1 / 2 ** bits of itself
+	_sub_bucket_bits = 5
+
+	def __init__(self):
+		self._counts = Counter()
+		self.count = 0
+		self.total = 0
+		self.min = None
+		self.max = None
+
+	@classmethod
+	def _index(cls, value):
+		bits = cls._sub_bucket_bits
+		if value < 1 << bits:
+			return value
+		magnitude = value.bit_length() - bits - 1
+		return ((magnitude + 1) << bits) + (value >> magnitude) - (1 << bits)
+
+	@classmethod
+	def _value(cls, index):
+		bits = cls._sub_bucket_bits
+		if index < 1 << bits:
+			return index
+		magnitude = (index >> bits) - 1
+		low = ((index & ((1 << bits) - 1)) + (1 << bits)) << magnitude
+		return low + (1 << magnitude) // 2
+
+	def record(self, value):
+		value = max(0, int(value))
+		self._counts[Histogram._index(value)] += 1
+		self.count += 1
+		self.total += value
+		self.min = value if self.min is None else min(self.min, value)
+		self.max = value if self.max is None else max(self.max, value)
+
+	def percentile(self, p):
+		if self.count == 0:
+			return None
+		target = max(1, ceil(p / 100 * self.count))
+		seen = 0
+		for index in sorted(self._counts):
+			seen += self._counts[index]
+			if seen >= target:
+				return min(max(Histogram._value(index), self.min), self.max)
+		return self.max
+
+	def to_dict(self):
+		return {
+			"count": self.count,
+			"min": self.min,
+			"mean": self.total / self.count if self.count else None,
+			"p50": self.percentile(50),
+			"p90": self.percentile(90),
+			"p99": self.percentile(99),
+			"max": self.max,
+			"buckets": {
+				Histogram._value(index): count
+				for index, count in sorted(self._counts.items())
+			}
+		}
+
+
+class Stats():
+
+	def __init__(self):
+		self._lock = Lock()
+		self._histograms = {}
+		self._bytes_sent = 0
+		self._bytes_received = 0
+		self._statuses = Counter()
+		self._errors = 0
+
+	def record(self, name, seconds):
+		# Times are kept in microseconds
+		with self._lock:
+			histogram = self._histograms.setdefault(name, Histogram())
+			histogram.record(seconds * 1e6)
+
+	@contextmanager
+	def timer(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.record(name, time.perf_counter() - start)
+
+	def record_request(self, name, seconds, sent, received, status):
+		self.record(name, seconds)
+		with self._lock:
+			self._bytes_sent += sent
+			self._bytes_received += received
+			if status is not None:
+				self._statuses[status] += 1
+
+	def record_error(self, name, seconds, sent):
+		self.record(f"{name}-error", seconds)
+		with self._lock:
+			self._bytes_sent += sent
+			self._errors += 1
+
+	def to_dict(self):
+		with self._lock:
+			return {
+				"unit": "us",
+				"histograms": {
+					name: histogram.to_dict()
+					for name, histogram in self._histograms.items()
+				},
+				"bytes_sent": self._bytes_sent,
+				"bytes_received": self._bytes_received,
+				"statuses": {str(status): n for status, n in self._statuses.items()},
+				"errors": self._errors
+			}
+
+	def summary(self):
+		stats = self.to_dict()
+		lines = []
+		for name, histogram in stats["histograms"].items():
+			ms = lambda key: f"{histogram[key] / 1000:.1f}"
+			lines.append(
+				f"{name}: {histogram['count']} calls, "
+				f"mean {histogram['mean'] / 1000:.1f}, p50 {ms('p50')}, "
+				f"p90 {ms('p90')}, p99 {ms('p99')}, max {ms('max')} ms"
+			)
+		statuses = ", ".join(f"{status}: {n}" for status, n in stats["statuses"].items())
+		lines.append(
+			f"sent {stats['bytes_sent']} bytes, received {stats['bytes_received']} bytes, "
+			f"{stats['errors']} errors" + (f", statuses {statuses}" if statuses else "")
+		)
+		return lines
+
+
+def dump_stats(stats, path):
+	with open(path, "w") as f:
+		json.dump({name: s.to_dict() for name, s in stats.items()}, f, indent=4)
+
+
+# Wraps a connection controller, every request goes through here and
+# everything else is passed to the wrapped controller
+class InstrumentedController():
+
+	def __init__(self, connection_controller, stats):
+		self._connection_controller = connection_controller
+		self._stats = stats
+
+	def __getattr__(self, attr):
+		return getattr(self._connection_controller, attr)
+
+	@property
+	def stateless(self):
+		controller = self._connection_controller.stateless
+		if controller is self._connection_controller:
+			return self
+		return InstrumentedController(controller, self._stats)
+
+	def _record(self, name, cmd, start, response):
+		seconds = time.perf_counter() - start
+		sent = len(cmd.encode("utf-8"))
+		if isinstance(response, tuple):
+			data, status = response
+		else:
+			data, status = response, None
+		if isinstance(data, str):
+			received = len(data.encode("utf-8"))
+		else:
+			received = len(data) if data is not None else 0
+		self._stats.record_request(name, seconds, sent, received, status)
+
+	def _call(self, name, f, cmd):
+		start = time.perf_counter()
+		try:
+			response = f(cmd)
+		except BaseException:
+			self._stats.record_error(name, time.perf_counter() - start, len(cmd.encode("utf-8")))
+			raise
+		self._record(name, cmd, start, response)
+		return response
+
+	def request(self, cmd):
+		return self._call("request", self._connection_controller.request, cmd)
+
+	def request_output(self, cmd):
+		return self._call("request", self._connection_controller.request_output, cmd)
+
+	def request_raw_output(self, cmd):
+		start = time.perf_counter()
+		try:
+			output, exit_code = self._connection_controller.request_raw_output(cmd)
+		except BaseException:
+			self._stats.record_error("request", time.perf_counter() - start, len(cmd.encode("utf-8")))
+			raise
+		seconds = time.perf_counter() - start
+		self._stats.record_request("request", seconds, len(cmd.encode("utf-8")), len(output), 200)
+		return output, exit_code
+
+	def stream_output(self, cmd, write):
+		received = 0
+
+		def _write(data):
+			nonlocal received
+			received += len(data)
+			write(data)
+
+		start = time.perf_counter()
+		try:
+			self._connection_controller.stream_output(cmd, _write)
+		except BaseException:
+			self._stats.record_error("request", time.perf_counter() - start, len(cmd.encode("utf-8")))
+			raise
+		seconds = time.perf_counter() - start
+		self._stats.record_request("request", seconds, len(cmd.encode("utf-8")), received, 200)
+
+	async def request_async(self, cmd):
+		start = time.perf_counter()
+		try:
+			response = await self._connection_controller.request_async(cmd)
+		except BaseException:
+			self._stats.record_error("request", time.perf_counter() - start, len(cmd.encode("utf-8")))
+			raise
+		self._record("request", cmd, start, response)
+		return response
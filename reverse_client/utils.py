@@ -1,7 +1,9 @@
-from functools import reduce
+from functools import reduce, lru_cache
 import re
+import gzip
+import zlib
 import argparse
-from prompt_toolkit.formatted_text.html import html_escape
+from base64 import b64decode
 
 url_regex = re.compile(
         r'^(?:http|ftp)s?://' # http:// or https://
@@ -30,6 +32,160 @@ def get_ip_port(uri):
 
 
 
+compressed_output_start = "GZIP-BASE64-START-"
+compressed_output_end = "GZIP-BASE64-END-"
+
+def compress_command(cmd, nonce):
+    # The output goes through gzip | base64 between two markers when gzip
+    # exists on the remote and the exit code of cmd is kept, the nonce
+    # keeps output that prints the markers from being taken for them
+    return (
+        "if command -v gzip >/dev/null 2>&1; then "
+        f"z() {{ echo {compressed_output_start}{nonce}; gzip -c | base64; echo {compressed_output_end}{nonce}; }}; "
+        "else z() { cat; }; fi; "
+        f"exec 4>&1; s=$({{ {{ {cmd}; echo $? >&3; }} | z >&4; }} 3>&1); exit $s"
+    )
+
+def decompress_output(content, nonce):
+    # Works on the raw bytes of a response, the output may not be text,
+    # content comes back as is when it does not decode
+    start_marker = f"{compressed_output_start}{nonce}".encode("utf-8")
+    end_marker = f"{compressed_output_end}{nonce}".encode("utf-8")
+
+    start = content.find(start_marker)
+    if start == -1:
+        return content
+    end = content.find(end_marker, start)
+    if end == -1:
+        return content
+
+    data = content[start + len(start_marker):end]
+    try:
+        data = gzip.decompress(b64decode(data))
+    except (ValueError, OSError, EOFError, zlib.error):
+        return content
+
+    end += len(end_marker)
+    if content[end:end + 1] == b"\n":
+        end += 1
+    return content[:start] + data + content[end:]
+
+
+framed_output_start = "RESPONSE-START-"
+framed_output_end = "RESPONSE-END-"
+
+def frame_command(cmd, frame_id):
+    # The output is put between two sentinels, the end one carries the
+    # exit code and starts on a line of its own even when the output
+    # does not end with a newline
+    return (
+        f"printf '%s\\n' {framed_output_start}{frame_id}; {{ {cmd}\n}}; "
+        f"printf '\\n%s:%s\\n' {framed_output_end}{frame_id} $?"
+    )
+
+def parse_framed_output(content, frame_id, strip_newline=True):
+    # Returns the output and exit code in a single pass over content,
+    # (None, None) when the start sentinel is not there and a None exit
+    # code when the end one is not, a command that ends the shell (e.g.
+    # exit) never prints it. content may be str or bytes, the output is
+    # of the same type and the exit code a str
+    start_marker = f"{framed_output_start}{frame_id}\n"
+    end_marker = f"\n{framed_output_end}{frame_id}:"
+    newline = "\n"
+    if not isinstance(content, str):
+        start_marker = start_marker.encode("utf-8")
+        end_marker = end_marker.encode("utf-8")
+        newline = b"\n"
+
+    start = content.find(start_marker)
+    if start == -1:
+        return None, None
+    start += len(start_marker)
+    end = content.find(end_marker, start)
+    if end == -1:
+        end = len(content)
+        if strip_newline and end > start and content[end - 1:end] == newline:
+            end -= 1
+        return content[start:end], None
+
+    code_start = end + len(end_marker)
+    code_end = content.find(newline, code_start)
+    if code_end == -1:
+        code_end = len(content)
+    exit_code = content[code_start:code_end].strip()
+    if not isinstance(exit_code, str):
+        exit_code = exit_code.decode("utf-8", errors="replace")
+
+    # The end marker takes the newline printed before the sentinel, a
+    # trailing newline of the output itself is dropped like a print adds
+    # it, unless the output has to come back byte for byte
+    if strip_newline and end > start and content[end - 1:end] == newline:
+        end -= 1
+    return content[start:end], exit_code
+
+
+class FramedOutputReader():
+    # parse_framed_output for a response read in pieces, the output is
+    # handed back as it arrives, only what could be the beginning of
+    # the end sentinel is held back
+    def __init__(self, frame_id):
+        self._start_marker = f"{framed_output_start}{frame_id}\n".encode("utf-8")
+        self._end_marker = f"\n{framed_output_end}{frame_id}:".encode("utf-8")
+        self._buffer = b""
+        self._started = False
+        self._ended = False
+
+    def feed(self, data):
+        self._buffer += data
+        if self._ended:
+            return b""
+
+        if not self._started:
+            start = self._buffer.find(self._start_marker)
+            if start == -1:
+                self._buffer = self._buffer[-len(self._start_marker):]
+                return b""
+            self._buffer = self._buffer[start + len(self._start_marker):]
+            self._started = True
+
+        end = self._buffer.find(self._end_marker)
+        if end != -1:
+            output = self._buffer[:end]
+            self._buffer = self._buffer[end + len(self._end_marker):]
+            self._ended = True
+            return output
+
+        keep = len(self._end_marker) - 1
+        output = self._buffer[:max(0, len(self._buffer) - keep)]
+        self._buffer = self._buffer[len(output):]
+        return output
+
+    def close(self):
+        # The exit code, None when the sentinels were not found
+        if not self._ended:
+            return None
+        exit_code = self._buffer.split(b"\n", 1)[0].strip()
+        return exit_code.decode("utf-8", errors="replace")
+
+
+class Base64Decoder():
+    # Decodes base64 split at any offset, whitespace included, keeping
+    # the characters of an incomplete quantum for the next piece
+    def __init__(self):
+        self._pending = b""
+
+    def decode(self, data):
+        data = self._pending + b"".join(data.split())
+        end = len(data) - len(data) % 4
+        self._pending = data[end:]
+        return b64decode(data[:end], validate=True)
+
+    def flush(self):
+        if self._pending:
+            raise ValueError("Incomplete base64 data")
+        return b""
+
+
 def get_logging_level_number(name):
     return {
         "NOTSET": 0,
@@ -43,6 +199,8 @@ def get_logging_level_number(name):
 
 def html_escape_decorator(func):
     def _f(s, txt, *args, **kwargs):
+        # Imported here so that utils does not pull in prompt_toolkit
+        from prompt_toolkit.formatted_text.html import html_escape
         txt = html_escape(txt)
         return func(s, txt, *args, **kwargs)
     return _f
@@ -61,37 +219,42 @@ class Namespace(argparse.Namespace):
             except:
                 return None
 
-# https://rosettacode.org/wiki/Tokenize_a_string_with_escaping#Python
-def tokenize(*delims):
+@lru_cache(maxsize=None)
+def _compile_tokenizer(delims, escs):
+    delims_esc_delims = tuple(
+        (delim, tuple(esc + delim for esc in escs)) for delim in delims
+    )
+    # Only positions holding the last character of a delimiter can end one
+    delim_ends = re.compile(
+        "[" + "".join(re.escape(delim[-1]) for delim in delims) + "]"
+    )
 
-    def go(s, escs):
-        t = ""
+    def go(s):
         res = []
-        delims_esc_delims = []
-        for delim in delims:
-            tmp = []
-            for esc in escs:
-                tmp.append(esc + delim)
-            delims_esc_delims.append((delim, tmp))
-        
-        delims_esc_delims = sorted(
-            delims_esc_delims, reverse=True, 
-            key=lambda t: len(t[1])
-        )
-
-        for c in s:
-            t += c
+        start = 0
+        for match in delim_ends.finditer(s):
+            end = match.end()
             for delim, esc_delims in delims_esc_delims:
-                ends_with_esc_delim = list(map(
-                    lambda esc_delim: t.endswith(esc_delim),
-                    esc_delims
-                ))
-
-                any_ends_with_esc_delim = any(ends_with_esc_delim)
-                if t.endswith(delim) and not any_ends_with_esc_delim:
-                    res.append(t[:-len(delim)])
-                    t = ""
-        res.append(t)
+                delim_start = end - len(delim)
+                if delim_start < start or not s.startswith(delim, delim_start):
+                    continue
+                if any(end - len(esc_delim) >= start and
+                        s.startswith(esc_delim, end - len(esc_delim))
+                        for esc_delim in esc_delims):
+                    continue
+                res.append(s[start:delim_start])
+                start = end
+                break
+        res.append(s[start:])
         return res
 
-    return lambda *esc: lambda s: go(s, esc)
\ No newline at end of file
+    return go
+
+# Same semantics as https://rosettacode.org/wiki/Tokenize_a_string_with_escaping#Python
+# in a single pass, escapes are kept in the tokens
+def tokenize(*delims):
+    return lambda *esc: _compile_tokenizer(delims, esc)
+
+# Drops the escapes tokenize keeps, for words that do not go through a shell
+def unescape(txt, esc="\\"):
+    return re.sub(re.escape(esc) + "(.)", r"\1", txt, flags=re.DOTALL)
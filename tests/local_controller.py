@@ -0,0 +1,62 @@
+import time
+import subprocess
+from threading import Lock
+from reverse_client.batch import BatchIO
+from reverse_client.shell import Shell
+from reverse_client.internal_commands import InternalCommands
+from reverse_client.connection_controller.connection_controller import ConnectionController
+
+
+# Runs the commands with a local sh the way a webshell would, the
+# commands it got are kept in the order they were sent
+class LocalController(ConnectionController):
+
+	def __init__(self, cwd, delays=None):
+		super(LocalController, self).__init__(interactive=False)
+		self._cwd = cwd
+		# Commands containing one of the keys wait that many seconds
+		self._delays = delays or {}
+		self._lock = Lock()
+		self.commands = []
+
+	def request(self, cmd):
+		with self._lock:
+			self.commands.append(cmd)
+		for key, delay in self._delays.items():
+			if key in cmd:
+				time.sleep(delay)
+		result = subprocess.run(["sh", "-c", cmd], capture_output=True, cwd=self._cwd)
+		return result.stdout, 200
+
+	def close(self):
+		pass
+
+
+# BatchIO that keeps what would be printed instead
+class RecordingIO(BatchIO):
+
+	def __init__(self):
+		super(RecordingIO, self).__init__(log_level=100)
+		self._lock = Lock()
+		self.printed = []
+
+	def print(self, txt):
+		with self._lock:
+			self.printed.append(txt)
+
+	def print_ansi(self, txt, end="\n"):
+		self.print(txt)
+
+
+def local_shell(controller, io=None, pipeline_workers=1, response_cache=None):
+	io = io or RecordingIO()
+	return Shell(
+		uri="http://localhost/",
+		virtual="on",
+		last_line="command-result",
+		io=io,
+		connection_controller=controller,
+		internal_commands=InternalCommands(io),
+		pipeline_workers=pipeline_workers,
+		response_cache=response_cache
+	)
@@ -0,0 +1,68 @@
+import json
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from reverse_client.batch import run_script, read_script
+from reverse_client.connection_controller.exceptions import RequestError
+from local_controller import LocalController, local_shell
+
+
+class FailingController(LocalController):
+
+	def request(self, cmd):
+		if "boom" in cmd:
+			raise RequestError("Connection refused")
+		return super(FailingController, self).request(cmd)
+
+
+class BatchTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+
+	def _run(self, commands, workers=1, controller_class=LocalController):
+		controller = controller_class(self.directory, delays={"slow": 0.2})
+		output = StringIO()
+		code = run_script(local_shell(controller), commands, workers, output)
+		return code, [json.loads(line) for line in output.getvalue().splitlines()]
+
+	def test_records(self):
+		code, records = self._run(["echo slow", "echo a; echo b", "pwd"], workers=3)
+		self.assertEqual(code, 0)
+		self.assertEqual([record["index"] for record in records], [0, 1, 2])
+		self.assertEqual([record["command"] for record in records], ["echo slow", "echo a; echo b", "pwd"])
+		self.assertEqual([record["output"] for record in records], ["slow", "a\nb", self.directory])
+		for record in records:
+			self.assertEqual(record["result"], "0")
+			self.assertEqual(record["status"], 200)
+			self.assertIsNone(record["error"])
+			self.assertGreaterEqual(record["elapsed"], 0)
+
+	def test_failed_command(self):
+		code, records = self._run(["echo a", "echo b; false", "echo c"])
+		self.assertEqual(code, 1)
+		self.assertEqual([record["result"] for record in records], ["0", "1", "0"])
+		self.assertEqual(records[1]["output"], "b")
+
+	def test_request_error(self):
+		code, records = self._run(["echo a", "echo boom", "echo c"], controller_class=FailingController)
+		self.assertEqual(code, 1)
+		self.assertEqual([record["output"] for record in records], ["a", None, "c"])
+		self.assertEqual(records[1]["error"], "Connection refused")
+
+	def test_state_after_failed_cd(self):
+		code, records = self._run(["cd missing", "pwd"])
+		self.assertEqual(code, 1)
+		self.assertEqual(records[1]["output"], self.directory)
+
+	def test_read_script(self):
+		path = f"{self.directory}/script"
+		with open(path, "w") as f:
+			f.write("# comment\n\n  echo a  \nls\n")
+		self.assertEqual(read_script(path), ["echo a", "ls"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from contextlib import redirect_stdout
+from reverse_client.exceptions import ShellException
+from local_controller import LocalController, local_shell
+
+
+class CommandPipelineTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+		os.mkdir(os.path.join(self.directory, "slowdir"))
+		open(os.path.join(self.directory, "slowdir", "marker"), "w").close()
+
+		self.controller = LocalController(self.directory, delays={"slow": 0.3})
+		self.shell = local_shell(self.controller, pipeline_workers=4)
+		self.assertTrue(self.shell._pre_start())
+		self.pipeline = self.shell._pipeline
+		self.addCleanup(self.pipeline.close)
+		self.stdout = StringIO()
+
+	def _submit(self, *commands):
+		with redirect_stdout(self.stdout):
+			for command in commands:
+				self.pipeline.submit(command)
+			self.pipeline.drain()
+		return self.stdout.getvalue().splitlines()
+
+	def test_responses_in_submit_order(self):
+		# The slow command is sent first but answered last
+		self.assertEqual(self._submit("echo slow", "echo fast", "echo last"), ["slow", "fast", "last"])
+		self.assertEqual(len(self.controller.commands), len(set(self.controller.commands)))
+
+	def test_drains_after_cd(self):
+		# ls is only built once the cd response set the cwd
+		self.assertEqual(self._submit("cd slowdir", "ls"), ["marker"])
+		self.assertEqual(self.shell.cwd, os.path.join(self.directory, "slowdir"))
+		self.assertIn(os.path.join(self.directory, "slowdir"), self.controller.commands[-1])
+
+	def test_failed_cd_keeps_cwd(self):
+		self.assertEqual(self._submit("cd missing", "ls"), ["slowdir"])
+		self.assertEqual(self.shell.cwd, self.directory)
+
+	def test_drains_before_internal_command(self):
+		with redirect_stdout(self.stdout):
+			self.pipeline.submit("echo slow")
+			# Jobs are not enabled, the command fails once the
+			# pipeline is drained
+			with self.assertRaises(ShellException):
+				self.pipeline.submit(":jobs")
+		self.assertEqual(self.stdout.getvalue().splitlines(), ["slow"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,89 @@
+import subprocess
+import unittest
+from uuid import uuid4
+from reverse_client.utils import (
+	frame_command, parse_framed_output, FramedOutputReader,
+	compress_command, decompress_output
+)
+
+
+def run(cmd):
+	return subprocess.run(["sh", "-c", cmd], capture_output=True).stdout
+
+
+class FramingTest(unittest.TestCase):
+
+	def setUp(self):
+		self.frame_id = uuid4().hex
+
+	def _round_trip(self, cmd, strip_newline=True):
+		content = b"<html>" + run(frame_command(cmd, self.frame_id)) + b"</html>"
+		return parse_framed_output(content, self.frame_id, strip_newline)
+
+	def test_output_and_exit_code(self):
+		self.assertEqual(self._round_trip("echo a; echo b"), (b"a\nb", "0"))
+		self.assertEqual(self._round_trip("echo a; false"), (b"a", "1"))
+		self.assertEqual(self._round_trip("(exit 7)"), (b"", "7"))
+
+	def test_output_without_trailing_newline(self):
+		self.assertEqual(self._round_trip("printf a"), (b"a", "0"))
+		self.assertEqual(self._round_trip("printf 'a\\n'", strip_newline=False), (b"a\n", "0"))
+		self.assertEqual(self._round_trip("printf a", strip_newline=False), (b"a", "0"))
+
+	def test_output_that_prints_markers(self):
+		output, exit_code = self._round_trip("echo RESPONSE-END-; echo RESPONSE-START-")
+		self.assertEqual((output, exit_code), (b"RESPONSE-END-\nRESPONSE-START-", "0"))
+
+	def test_missing_end_sentinel(self):
+		# exit ends the shell before the end sentinel is printed, all
+		# that follows the start sentinel is the output
+		for cmd, output in [("echo a; exit 3", b"a"), ("exit 3", b"")]:
+			content = run(frame_command(cmd, self.frame_id))
+			self.assertEqual(parse_framed_output(content, self.frame_id), (output, None))
+		content = run(frame_command("printf a; exit 3", self.frame_id))
+		self.assertEqual(parse_framed_output(content.decode("utf-8"), self.frame_id), ("a", None))
+
+	def test_missing_start_sentinel(self):
+		self.assertEqual(parse_framed_output(b"a\n0", self.frame_id), (None, None))
+		self.assertEqual(parse_framed_output("", self.frame_id), (None, None))
+
+	def test_other_frame_id(self):
+		content = run(frame_command("echo a", uuid4().hex))
+		self.assertEqual(parse_framed_output(content, self.frame_id), (None, None))
+
+	def test_str_content(self):
+		content = run(frame_command("echo a", self.frame_id)).decode("utf-8")
+		self.assertEqual(parse_framed_output(content, self.frame_id), ("a", "0"))
+
+	def test_reader_matches_parser(self):
+		content = b"junk" + run(frame_command("printf 'a\\nbc'; (exit 2)", self.frame_id)) + b"junk"
+		expected = parse_framed_output(content, self.frame_id, strip_newline=False)
+		for size in range(1, len(content) + 1):
+			reader = FramedOutputReader(self.frame_id)
+			output = b"".join(
+				reader.feed(content[i:i + size]) for i in range(0, len(content), size)
+			)
+			self.assertEqual((output, reader.close()), expected, size)
+
+	def test_reader_missing_sentinels(self):
+		reader = FramedOutputReader(self.frame_id)
+		self.assertEqual(reader.feed(b"a\n0\n"), b"")
+		self.assertIsNone(reader.close())
+
+	def test_compressed_round_trip(self):
+		nonce = uuid4().hex
+		cmd = compress_command(frame_command("echo a; echo GZIP-BASE64-END-; false", self.frame_id), nonce)
+		content = decompress_output(run(cmd), nonce)
+		self.assertEqual(
+			parse_framed_output(content, self.frame_id), (b"a\nGZIP-BASE64-END-", "1")
+		)
+
+	def test_decompress_falls_back_to_raw(self):
+		nonce = uuid4().hex
+		content = f"GZIP-BASE64-START-{nonce}\nnot base64\nGZIP-BASE64-END-{nonce}\n".encode("utf-8")
+		self.assertEqual(decompress_output(content, nonce), content)
+		self.assertEqual(decompress_output(b"plain", nonce), b"plain")
+
+
+if __name__ == "__main__":
+	unittest.main()
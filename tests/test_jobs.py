@@ -0,0 +1,76 @@
+import os
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+from reverse_client.jobs import JobManager
+from reverse_client.exceptions import ShellException
+from local_controller import LocalController, RecordingIO
+
+
+class JobManagerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+		self.io = RecordingIO()
+		self.jobs = JobManager(
+			self.io, LocalController(self.directory),
+			poll_interval=0.05, directory=self.directory
+		)
+
+	def _wait(self, job, timeout=10):
+		deadline = time.monotonic() + timeout
+		while job.state == "running":
+			self.assertLess(time.monotonic(), deadline, "The job did not finish")
+			time.sleep(0.05)
+
+	def test_output_and_exit_code(self):
+		job = self.jobs.start("echo a; echo b >&2; exit 3")
+		self._wait(job)
+		self.assertEqual((job.state, job.exit_code), ("done", "3"))
+		self.assertIn("a\nb\n", self.io.printed)
+		self.assertFalse(os.path.exists(job.path))
+
+	def test_cwd(self):
+		job = self.jobs.start("pwd", cwd=self.directory)
+		self._wait(job)
+		self.assertEqual((job.state, job.exit_code), ("done", "0"))
+		self.assertIn(f"{self.directory}\n", self.io.printed)
+
+	def test_kill(self):
+		job = self.jobs.start("sleep 30")
+		time.sleep(0.2)
+		self.jobs.kill(job.id)
+		self.assertEqual(job.state, "killed")
+		with self.assertRaises(ShellException):
+			self.jobs.kill(job.id)
+		time.sleep(0.2)
+		self.assertEqual(job.state, "killed")
+
+	def test_lost(self):
+		job = self.jobs.start("sleep 30")
+		deadline = time.monotonic() + 10
+		while not os.path.exists(f"{job.path}/pid"):
+			self.assertLess(time.monotonic(), deadline)
+			time.sleep(0.05)
+		time.sleep(0.1)
+		with open(f"{job.path}/pid") as f:
+			pid = int(f.read())
+		# Without an exit file the job shell is gone for good
+		os.kill(pid, signal.SIGKILL)
+		self._wait(job)
+		self.assertEqual(job.state, "lost")
+		try:
+			os.killpg(pid, signal.SIGTERM)
+		except OSError:
+			pass
+
+	def test_unknown_job(self):
+		with self.assertRaises(ShellException):
+			self.jobs.kill(42)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from reverse_client.response_cache import is_read_only
+
+
+class IsReadOnlyTest(unittest.TestCase):
+
+	def test_allowed(self):
+		for cmd in [
+			"ls -la", "cat /etc/passwd", "id", "ps aux | grep sh",
+			"uname -a && whoami; pwd", "env", "hostname", "date",
+			"ifconfig", "ifconfig -a", "ip a", "ip -4 addr show",
+			"ip route get 1.1.1.1", "sort -n f", "sort -u", "uniq -c f",
+			"echo a\\;b"
+		]:
+			self.assertTrue(is_read_only(cmd), cmd)
+
+	def test_denied(self):
+		for cmd in [
+			"", "rm -rf /tmp/x", "ls; rm f", "ls && touch f", "cat f | tee g",
+			"echo a > f", "echo `id`", "echo $(id)", "diff <(ls) f",
+			"env rm f", "hostname evil", "date -s 2020-01-01",
+			"ifconfig eth0 down", "ip link set eth0 down", "ip route add x",
+			"ip", "sort -o f f", "sort -no f f", "sort --output=f f",
+			"uniq in out"
+		]:
+			self.assertFalse(is_read_only(cmd), cmd)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,53 @@
+import random
+from math import ceil
+import unittest
+from reverse_client.stats import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+
+	def test_empty(self):
+		histogram = Histogram()
+		self.assertIsNone(histogram.percentile(50))
+		self.assertEqual(histogram.to_dict()["count"], 0)
+
+	def test_small_values_are_exact(self):
+		histogram = Histogram()
+		for value in range(1, 32):
+			histogram.record(value)
+		self.assertEqual(histogram.percentile(0), 1)
+		self.assertEqual(histogram.percentile(50), 16)
+		self.assertEqual(histogram.percentile(100), 31)
+
+	def test_percentiles_within_bucket_error(self):
+		rng = random.Random(0)
+		values = sorted(rng.randint(0, 10 ** 7) for _ in range(10000))
+		histogram = Histogram()
+		for value in values:
+			histogram.record(value)
+		for p in [1, 50, 90, 99, 99.9]:
+			expected = values[max(1, ceil(p / 100 * len(values))) - 1]
+			self.assertLessEqual(abs(histogram.percentile(p) - expected), expected / 32, p)
+		self.assertEqual(histogram.percentile(100), values[-1])
+
+	def test_percentiles_clamped_to_min_and_max(self):
+		histogram = Histogram()
+		histogram.record(1000001)
+		self.assertEqual(histogram.percentile(50), 1000001)
+		self.assertEqual(histogram.to_dict()["min"], 1000001)
+
+	def test_to_dict(self):
+		histogram = Histogram()
+		for value in [10, 20, 30, 40.7, -5]:
+			histogram.record(value)
+		summary = histogram.to_dict()
+		self.assertEqual(summary["count"], 5)
+		self.assertEqual(summary["min"], 0)
+		self.assertEqual(summary["max"], 40)
+		self.assertEqual(summary["mean"], 20)
+		self.assertEqual(summary["p50"], 20)
+		self.assertEqual(sum(summary["buckets"].values()), 5)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,107 @@
+import random
+import unittest
+from reverse_client.utils import tokenize
+
+
+# The character by character tokenizer utils.tokenize replaced, from
+# https://rosettacode.org/wiki/Tokenize_a_string_with_escaping#Python
+def reference_tokenize(*delims):
+
+	def go(s, escs):
+		t = ""
+		res = []
+		delims_esc_delims = []
+		for delim in delims:
+			tmp = []
+			for esc in escs:
+				tmp.append(esc + delim)
+			delims_esc_delims.append((delim, tmp))
+
+		delims_esc_delims = sorted(
+			delims_esc_delims, reverse=True,
+			key=lambda t: len(t[1])
+		)
+
+		for c in s:
+			t += c
+			for delim, esc_delims in delims_esc_delims:
+				ends_with_esc_delim = list(map(
+					lambda esc_delim: t.endswith(esc_delim),
+					esc_delims
+				))
+
+				any_ends_with_esc_delim = any(ends_with_esc_delim)
+				if t.endswith(delim) and not any_ends_with_esc_delim:
+					res.append(t[:-len(delim)])
+					t = ""
+		res.append(t)
+		return res
+
+	return lambda *esc: lambda s: go(s, esc)
+
+
+# The delimiter sets used by shell_io, autocompleters, internal_commands
+# and response_cache, and some that overlap each other
+delimiter_sets = [
+	("&&", ";", " "),
+	("&&", ";"),
+	(";", "&&", " "),
+	(" ",),
+	("&&", "||", ";", "|"),
+	("|", "||"),
+	("&", "&&", "&&&"),
+	("ab", "b", "bab"),
+]
+
+cases = [
+	"",
+	" ",
+	"ls -la",
+	"cd /tmp && ls; pwd",
+	"echo a\\ b c",
+	"echo a\\;b; echo c\\&&d && e",
+	"a\\\\ b",
+	"a || b | c && d ; e",
+	"a|||b",
+	"a&&&b",
+	"&&&&",
+	";;  ;",
+	"\\",
+	"trailing\\",
+	"x\\|\\|y || z",
+	"ababab bab",
+]
+
+
+class TokenizeTest(unittest.TestCase):
+
+	def _check(self, delims, s):
+		self.assertEqual(
+			tokenize(*delims)("\\")(s), reference_tokenize(*delims)("\\")(s),
+			f"{delims!r} {s!r}"
+		)
+
+	def test_cases(self):
+		for delims in delimiter_sets:
+			for s in cases:
+				self._check(delims, s)
+
+	def test_random(self):
+		rng = random.Random(0)
+		alphabet = "ab &|;\\"
+		for delims in delimiter_sets:
+			for _ in range(2000):
+				s = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+				self._check(delims, s)
+
+	def test_escapes_are_kept(self):
+		self.assertEqual(tokenize(" ")("\\")("a\\ b c"), ["a\\ b", "c"])
+
+	def test_without_escapes(self):
+		for delims in delimiter_sets:
+			for s in cases:
+				self.assertEqual(tokenize(*delims)()(s), reference_tokenize(*delims)()(s))
+
+
+if __name__ == "__main__":
+	unittest.main()